@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Alokasi stock berurutan (FIFO/FEFO) untuk SO line yang berebut batch yang sama.
+# Semua perhitungan memakai array terurut + cumulative sum per grup, tanpa loop
+# Python per line, sehingga tetap linear untuk jutaan line.
+
+ALOKASI_COLUMNS = ['Qty_Alokasi', 'Sisa_Stock_Alokasi', 'Kekurangan_Alokasi']
+
+# Toleransi untuk membuang irisan interval yang hanya sisa pembulatan float
+EPS = 1e-9
+
+
+def _stock_per_batch(cube, batch_order):
+    # Stock bersih per (Material, Batch) dari cube; stock negatif tidak bisa dialokasikan
+    sort_cols = ['Material', 'Batch']
+    if batch_order != 'Batch':
+        if batch_order not in cube.columns:
+            raise ValueError(f"Kolom urutan batch '{batch_order}' tidak ditemukan di sheet stock (Loct_*)")
+        sort_cols = ['Material', batch_order, 'Batch']
+
+    stock = cube.loc[cube['Baris_Stock'] > 0, ['Stock'] + sort_cols[1:-1]].reset_index()
+    stock['Stock_Alokasi'] = stock['Stock'].clip(lower=0)
+    return stock.sort_values(sort_cols, kind='stable').reset_index(drop=True)
+
+
+def _allocate_batched(lines, stock):
+    # lines sudah urut per (Material, Batch Number, prioritas)
+    if lines.empty:
+        return lines.assign(Qty_Alokasi=0.0, Sisa_Stock_Alokasi=0.0, _stock_row=-1)
+
+    lines = lines.merge(
+        stock[['Material', 'Batch', 'Stock_Alokasi']].assign(_stock_row=np.arange(len(stock))),
+        left_on=['Material', 'Batch Number'],
+        right_on=['Material', 'Batch'],
+        how='left'
+    )
+    avail = lines['Stock_Alokasi'].fillna(0).to_numpy()
+    qty = lines['Qty'].to_numpy()
+    cum = lines.groupby(['Material', 'Batch Number'], sort=False)['Qty'].cumsum().to_numpy()
+
+    lines['Qty_Alokasi'] = np.clip(avail - (cum - qty), 0, qty)
+    lines['Sisa_Stock_Alokasi'] = np.clip(avail - cum, 0, None)
+    lines['_stock_row'] = lines['_stock_row'].fillna(-1).astype(int)
+    return lines
+
+
+def _allocate_unbatched(lines, stock):
+    # Line tanpa batch memakai sisa stock per batch sesuai urutan batch.
+    # Setiap material dipetakan ke rentang sendiri di satu sumbu global: line
+    # menjadi interval [s, e) permintaan kumulatif, batch menjadi interval
+    # [a, b) stock kumulatif, dan alokasi = panjang irisan kedua interval.
+    stock = stock[stock['Sisa'] > 0].reset_index(drop=True)
+
+    demand = lines.groupby('Material')['Qty'].sum()
+    supply = stock.groupby('Material')['Sisa'].sum()
+    span = pd.concat([demand, supply], axis=1).fillna(0).max(axis=1).sort_index()
+    base = span.cumsum() - span
+
+    qty = lines['Qty'].to_numpy()
+    line_cum = lines.groupby('Material', sort=False)['Qty'].cumsum().to_numpy()
+    line_end = base.reindex(lines['Material']).to_numpy() + line_cum
+    line_start = line_end - qty
+
+    batch_end = base.reindex(stock['Material']).to_numpy() + stock.groupby('Material', sort=False)['Sisa'].cumsum().to_numpy()
+    batch_start = batch_end - stock['Sisa'].to_numpy()
+
+    first = np.searchsorted(batch_end, line_start, side='right')
+    last = np.searchsorted(batch_start, line_end, side='left') - 1
+    count = np.clip(last - first + 1, 0, None)
+
+    line_idx = np.repeat(np.arange(len(lines)), count)
+    offsets = np.cumsum(count) - count
+    batch_idx = first[line_idx] + np.arange(len(line_idx)) - offsets[line_idx]
+
+    overlap = np.minimum(line_end[line_idx], batch_end[batch_idx]) - np.maximum(line_start[line_idx], batch_start[batch_idx])
+    keep = (overlap > EPS) & (lines['Material'].to_numpy()[line_idx] == stock['Material'].to_numpy()[batch_idx])
+    line_idx, batch_idx, overlap = line_idx[keep], batch_idx[keep], overlap[keep]
+
+    pairs = pd.DataFrame({
+        'Line_Index': lines['_pos'].to_numpy()[line_idx],
+        'Batch': stock['Batch'].to_numpy()[batch_idx],
+        'Qty_Alokasi': overlap,
+    })
+
+    lines['Qty_Alokasi'] = np.bincount(line_idx, weights=overlap, minlength=len(lines))
+    lines['Sisa_Stock_Alokasi'] = np.clip(supply.reindex(lines['Material']).fillna(0).to_numpy() - line_cum, 0, None)
+    return lines, pairs
+
+
+def allocate_stock(df_so, cube, line_priority=('Shipment Number',), batch_order='Batch'):
+    # Hasil:
+    # - per_line: Qty_Alokasi / Sisa_Stock_Alokasi / Kekurangan_Alokasi sejajar
+    #   dengan urutan baris df_so
+    # - pairs: alokasi line tanpa batch ke batch (Line_Index = posisi baris df_so)
+    # cube: hasil cube.build_stock_cube
+    line_priority = list(line_priority)
+
+    lines = df_so[['Material', 'Batch Number'] + line_priority].copy()
+    lines['Qty'] = df_so['Ordered Quantity'].fillna(0).clip(lower=0).to_numpy()
+    lines['_pos'] = np.arange(len(lines))
+
+    stock = _stock_per_batch(cube, batch_order)
+
+    has_batch = lines['Batch Number'].notna()
+    batched = lines[has_batch].sort_values(['Material', 'Batch Number'] + line_priority + ['_pos'], kind='stable')
+    batched = _allocate_batched(batched, stock)
+
+    # Sisa stock per batch setelah dipakai line yang sudah punya batch
+    matched = batched['_stock_row'].to_numpy() >= 0
+    used = np.bincount(
+        batched['_stock_row'].to_numpy()[matched],
+        weights=batched['Qty_Alokasi'].to_numpy()[matched],
+        minlength=len(stock)
+    )
+    stock['Sisa'] = stock['Stock_Alokasi'].to_numpy() - used
+
+    unbatched = lines[~has_batch].sort_values(['Material'] + line_priority + ['_pos'], kind='stable')
+    unbatched, pairs = _allocate_unbatched(unbatched, stock)
+
+    cols = ['_pos', 'Qty', 'Qty_Alokasi', 'Sisa_Stock_Alokasi']
+    per_line = pd.concat([batched[cols], unbatched[cols]]).sort_values('_pos')
+    per_line['Kekurangan_Alokasi'] = per_line['Qty'] - per_line['Qty_Alokasi']
+
+    return per_line[ALOKASI_COLUMNS].reset_index(drop=True), pairs
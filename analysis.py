@@ -0,0 +1,294 @@
+import pandas as pd
+
+from allocation import allocate_stock
+from compact import compact_frame, memory_report
+from cube import build_stock_cube
+from instrument import stage
+from numeric import parse_number_column
+from sku_index import build_sku_index
+from status import classify_balance, classify_kecukupan
+
+# Modul analisis murni (tanpa Streamlit): dipakai oleh app.py dan bisa
+# dijalankan/di-benchmark langsung dari script.
+
+TANPA_BATCH = 'TANPA BATCH'
+
+# Kolom detail SO per line yang ditampilkan di tab 2 dan di-export
+DETAIL_COLUMNS = [
+    'Shipment Number',
+    'Material',
+    'Batch Number',
+    'Ordered Quantity',
+    'Stock_Batch',
+    'Balance_Per_Line',
+    'Total_Stock_Material',
+    'Status_Stock',
+    'Qty_Alokasi',
+    'Sisa_Stock_Alokasi',
+    'Kekurangan_Alokasi',
+    'Status_Alokasi',
+]
+
+# Kolom detail SO yang ditampilkan per SKU di tab 3
+SKU_DETAIL_COLUMNS = ['Shipment Number', 'Batch Number', 'Ordered Quantity', 'Stock_Batch', 'Balance_Per_Line', 'Status_Stock']
+SKU_STOCK_COLUMNS = ['Material', 'Batch', 'Stock', 'Qty_SO', 'Sisa_Stock']
+# Urutan default tabel detail di tab 2 / report
+DETAIL_SORT = ['Shipment Number', 'Status_Stock', 'Material']
+
+
+def is_tanpa_batch(batch):
+    # Batch kosong bisa berupa null (mode compact) atau sentinel 'TANPA BATCH'
+    return batch.isna() | (batch == TANPA_BATCH)
+
+
+# --- PREPROCESSING ---
+def preprocess_so(df_so):
+    df_so = df_so.reset_index(drop=True)
+    df_so['Material'] = df_so['Material'].astype(str)
+
+    # Frame dari ingest.read_workbook sudah numerik; frame dari sumber lain
+    # (mis. pd.read_excel langsung) diparsing di sini
+    df_so['Ordered Quantity'], _ = parse_number_column(df_so['Ordered Quantity'])
+
+    # Cek nama kolom Batch di df_so
+    if 'Batch Number' not in df_so.columns:
+        batch_col = [col for col in df_so.columns if 'batch' in col.lower()]
+        if not batch_col:
+            raise ValueError("Kolom 'Batch Number' tidak ditemukan di sheet SO_B2B")
+        df_so.rename(columns={batch_col[0]: 'Batch Number'}, inplace=True)
+
+    return df_so
+
+
+def preprocess_loct(df_loct):
+    df_loct = df_loct.reset_index(drop=True)
+    df_loct['Material'] = df_loct['Material'].astype(str)
+    df_loct['Unrestricted'], _ = parse_number_column(df_loct['Unrestricted'])
+    return df_loct
+
+
+def preprocess(df_so, df_loct):
+    return preprocess_so(df_so), preprocess_loct(df_loct)
+
+
+# --- DETAIL SO PER LINE ---
+def build_detail(df_so, cube, material, fill_missing_batch=True):
+    # Buat dataframe detail dengan status stock
+    df_so_detail = df_so.copy()
+    if fill_missing_batch:
+        df_so_detail['Batch Number'] = df_so_detail['Batch Number'].fillna(TANPA_BATCH)
+
+    # Lookup stock per (Material, Batch) langsung ke index cube; batch kosong tidak pernah cocok
+    keys = pd.MultiIndex.from_arrays([df_so_detail['Material'], df_so_detail['Batch Number']])
+    df_so_detail['Stock_Batch'] = cube['Stock'].reindex(keys).fillna(0).to_numpy()
+    df_so_detail['Balance_Per_Line'] = df_so_detail['Stock_Batch'] - df_so_detail['Ordered Quantity']
+
+    # Tambah kolom Status
+    df_so_detail['Status_Stock'] = classify_balance(
+        df_so_detail['Balance_Per_Line'],
+        tanpa_batch=is_tanpa_batch(df_so_detail['Batch Number'])
+    )
+
+    # Tambah kolom global stock per material
+    df_so_detail['Total_Stock_Material'] = (
+        material['Total_Stock_Material'].reindex(df_so_detail['Material']).fillna(0).to_numpy()
+    )
+
+    return df_so_detail
+
+
+# --- ANALISIS DEFISIT PER BATCH ---
+def deficit_batches(cube):
+    return cube[(cube['Baris_SO'] > 0) & (cube['Sisa_Stock'] < 0)]
+
+
+def deficit_shipments(df_so_with_batch, deficit_index):
+    # Pasangan (Material, Batch, Shipment) unik untuk batch defisit, urutan kemunculan pertama.
+    # Bisa dihitung per chunk; hasil gabungan cukup di-drop_duplicates lagi.
+    keys = pd.MultiIndex.from_arrays([df_so_with_batch['Material'], df_so_with_batch['Batch Number']])
+    so_deficit = df_so_with_batch.loc[keys.isin(deficit_index), ['Material', 'Batch Number', 'Shipment Number']]
+    return so_deficit.assign(**{'Shipment Number': so_deficit['Shipment Number'].astype(str)}).drop_duplicates()
+
+
+def build_deficit(cube, shipments):
+    deficit = deficit_batches(cube)
+    joined = shipments.groupby(['Material', 'Batch Number'], observed=True, sort=False)['Shipment Number'].agg(', '.join)
+
+    deficit_df = pd.DataFrame({
+        'Total_Ordered': deficit['Qty_SO'],
+        'Stock_Onhand': deficit['Stock'],
+        'Balance': deficit['Sisa_Stock'],
+        'List_Shipment_Numbers': joined.reindex(deficit.index).to_numpy(),
+    }, index=deficit.index)
+    return deficit_df.reset_index()
+
+
+# --- OPSI SUBSTITUSI UNTUK MATERIAL DEFISIT ---
+def build_substitution(cube, deficit_df):
+    list_material_defisit = deficit_df['Material'].unique()
+    subset = cube[cube.index.get_level_values('Material').isin(list_material_defisit)]
+
+    substitusi_df = pd.DataFrame({
+        'Stock_Gudang': subset['Stock'],
+        'Qty_SO_Terpakai': subset['Qty_SO'],
+        'Sisa_Stock_Bisa_Pakai': subset['Sisa_Stock'],
+    }).reset_index()
+
+    # Kategori status sudah berurutan DEFISIT -> PAS -> SURPLUS
+    substitusi_df['Status'] = classify_balance(substitusi_df['Sisa_Stock_Bisa_Pakai'])
+    substitusi_df = substitusi_df.sort_values(
+        by=['Material', 'Status', 'Sisa_Stock_Bisa_Pakai'],
+        ascending=[True, True, True]
+    )
+
+    return substitusi_df
+
+
+# --- SARAN BATCH UNTUK SO TANPA BATCH ---
+SARAN_COLUMNS = ['Shipment_Number', 'Material', 'Batch', 'Stock_Available', 'Qty_Dibutuhkan', 'Status_Kecukupan']
+
+def suggest_batches(df_tanpa_batch, cube, alokasi=None):
+    # Stock positif per (Material, Batch) diambil dari cube, lalu di-join
+    # ke semua line tanpa batch sekaligus (bukan per baris).
+    stock = cube.loc[cube['Stock_Positif'].notna(), ['Stock_Positif']].reset_index()
+    stock.rename(columns={'Stock_Positif': 'Stock_Available'}, inplace=True)
+
+    lines = df_tanpa_batch[['Shipment Number', 'Material', 'Ordered Quantity']].rename(columns={
+        'Shipment Number': 'Shipment_Number',
+        'Ordered Quantity': 'Qty_Dibutuhkan'
+    })
+    lines['Line_Index'] = df_tanpa_batch.index
+
+    # Left merge menjaga urutan line, batch per line tetap urut seperti hasil groupby
+    df_saran = lines.merge(stock, on='Material', how='left')
+
+    no_stock = df_saran['Batch'].isna()
+    df_saran['Batch'] = df_saran['Batch'].astype(object).where(~no_stock, 'TIDAK ADA STOCK')
+    df_saran['Stock_Available'] = df_saran['Stock_Available'].fillna(0)
+    df_saran['Status_Kecukupan'] = classify_kecukupan(
+        df_saran['Stock_Available'],
+        df_saran['Qty_Dibutuhkan'],
+        no_stock=no_stock
+    )
+
+    cols = SARAN_COLUMNS
+    if alokasi is not None:
+        # Qty yang benar-benar dialokasikan ke batch ini setelah SO lain dilayani
+        df_saran = df_saran.merge(alokasi, on=['Line_Index', 'Batch'], how='left')
+        df_saran['Qty_Alokasi'] = df_saran['Qty_Alokasi'].fillna(0)
+        cols = SARAN_COLUMNS + ['Qty_Alokasi']
+
+    return df_saran[cols].reset_index(drop=True)
+
+
+# --- PIPELINE LENGKAP ---
+def analyze_frames(df_so, df_loct, line_priority=('Shipment Number',), batch_order='Batch', fill_missing_batch=True,
+                   stages=None, preprocessed=False):
+    # Inti analisis (tanpa compact dan index SKU); juga dijalankan per partisi
+    # material di worker process (locations.py). Hasil: dict frame, has_batch.
+    # preprocessed=True: frame sudah melewati preprocess() (mis. di run_incremental)
+    stages = [] if stages is None else stages
+    if not preprocessed:
+        with stage(stages, 'preprocessing', rows_in=len(df_so) + len(df_loct)) as record:
+            df_so, df_loct = preprocess(df_so, df_loct)
+            record['rows_out'] = len(df_so) + len(df_loct)
+
+    # Semua agregasi stock/demand per (Material, Batch) dihitung sekali di sini
+    with stage(stages, 'cube', rows_in=len(df_so) + len(df_loct)) as record:
+        cube, material = build_stock_cube(df_so, df_loct)
+        record['rows_out'] = len(cube)
+
+    # Mode compact: batch kosong tetap null, bukan string 'TANPA BATCH'
+    with stage(stages, 'detail_merge', rows_in=len(df_so)) as record:
+        df_so_detail = build_detail(df_so, cube, material, fill_missing_batch=fill_missing_batch)
+        record['rows_out'] = len(df_so_detail)
+
+    # Alokasi stock berurutan antar line yang berebut batch yang sama
+    with stage(stages, 'allocation', rows_in=len(df_so)) as record:
+        per_line, alokasi_tanpa_batch = allocate_stock(df_so, cube, line_priority, batch_order)
+        for col in per_line.columns:
+            df_so_detail[col] = per_line[col].to_numpy()
+        # Kekurangan > 0 -> DEFISIT, sisa 0 -> PAS, sisa > 0 -> SURPLUS
+        df_so_detail['Status_Alokasi'] = classify_balance(
+            df_so_detail['Sisa_Stock_Alokasi'] - df_so_detail['Kekurangan_Alokasi'],
+            tanpa_batch=is_tanpa_batch(df_so_detail['Batch Number'])
+        )
+        record['rows_out'] = len(alokasi_tanpa_batch)
+
+    # Filter SO yang memiliki batch number saja untuk analisis defisit
+    df_so_with_batch = df_so[df_so['Batch Number'].notna()]
+    with stage(stages, 'deficit', rows_in=len(cube)) as record:
+        deficit_df = build_deficit(cube, deficit_shipments(df_so_with_batch, deficit_batches(cube).index))
+        record['rows_out'] = len(deficit_df)
+    with stage(stages, 'substitution', rows_in=len(cube)) as record:
+        substitusi_df = build_substitution(cube, deficit_df)
+        record['rows_out'] = len(substitusi_df)
+
+    frames = {
+        'so': df_so,
+        'loct': df_loct,
+        'cube': cube,
+        'material': material,
+        'detail': df_so_detail,
+        'alokasi_tanpa_batch': alokasi_tanpa_batch,
+        'deficit': deficit_df,
+        'substitusi': substitusi_df,
+    }
+    return frames, not df_so_with_batch.empty
+
+
+def finish_result(frames, has_batch, stages, compact=False):
+    # Dict hasil akhir: frame (dikompres bila compact) + index per SKU
+    result = {'has_batch': has_batch, 'memory': None, 'stages': stages}
+
+    if compact:
+        with stage(stages, 'compact', rows_in=sum(len(df) for df in frames.values())):
+            compacted = {name: compact_frame(df) for name, df in frames.items()}
+            # Pembanding = frame mode biasa: detail mode biasa berisi sentinel 'TANPA BATCH', bukan null
+            uncompacted = {**frames, 'detail': frames['detail'].assign(
+                **{'Batch Number': frames['detail']['Batch Number'].fillna(TANPA_BATCH)}
+            )}
+            result['memory'] = memory_report(uncompacted, compacted)
+            frames = compacted
+
+    result.update(frames)
+    with stage(stages, 'sku_index', rows_in=len(frames['detail'])):
+        attach_sku_index(result)
+    return result
+
+
+def run_analysis(df_so, df_loct, line_priority=('Shipment Number',), batch_order='Batch', compact=False,
+                 preprocessed=False):
+    # result['stages']: waktu/baris/memori per tahap (lihat instrument.py)
+    stages = []
+    frames, has_batch = analyze_frames(df_so, df_loct, line_priority, batch_order, not compact, stages, preprocessed)
+    return finish_result(frames, has_batch, stages, compact)
+
+
+def attach_sku_index(result):
+    # Index per SKU untuk tab 3: dibangun sekali, lookup per material tanpa scan penuh
+    result['materials'] = sorted(result['loct']['Material'].unique())
+    result['sku_stock'] = build_sku_index(result['cube'].reset_index()[SKU_STOCK_COLUMNS])
+    result['sku_detail'] = build_sku_index(
+        result['detail'][['Material'] + SKU_DETAIL_COLUMNS],
+        sort_by=('Material', 'Shipment Number')
+    )
+    # Posisi baris detail dalam urutan DETAIL_SORT, supaya tab 2 tidak mengurutkan ulang tiap rerun
+    result['detail_order'] = (
+        result['detail'][DETAIL_SORT].reset_index(drop=True).sort_values(DETAIL_SORT, kind='stable').index.to_numpy()
+    )
+    return result
+
+
+# --- TABEL REPORT (TAB 1 + TAB 2) ---
+def build_report_tables(result):
+    # Semua tabel yang bisa di-download dari dashboard, tanpa filter UI
+    df_so_detail = result['detail']
+    df_tanpa_batch = df_so_detail[is_tanpa_batch(df_so_detail['Batch Number'])]
+
+    return {
+        'defisit': result['deficit'],
+        'substitusi': result['substitusi'],
+        'detail': df_so_detail[DETAIL_COLUMNS].sort_values(DETAIL_SORT),
+        'saran': suggest_batches(df_tanpa_batch, result['cube'], result['alokasi_tanpa_batch']),
+    }
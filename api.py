@@ -0,0 +1,369 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from cli import PRIORITY_OPTIONS, analysis_summary
+from export import MIME_TYPES
+from instrument import get_logger, log_stages
+from locations import build_location_report_tables, run_locations
+from numeric import NUMBER_FORMATS
+from snapshot_cache import has_snapshot, read_workbook_cached
+
+# HTTP API lokal untuk sistem lain (WMS, script penjadwalan): kirim workbook
+# (atau hash file yang snapshot-nya sudah ada di cache), analisis masuk antrian
+# worker terbatas, lalu status di-poll dan hasil diambil sebagai JSON/Parquet.
+# Job di-key dengan hash isi file + parameter, jadi upload identik memakai
+# job yang sama (tidak dianalisis dua kali).
+#
+#   python api.py --port 8503 --workers 2
+#   curl -X POST --data-binary @gudang.xlsx "http://127.0.0.1:8503/jobs?priority=shipment"
+#   curl -X POST -H "Content-Type: application/json" -d '{"file_hash": "<sha256>"}' http://127.0.0.1:8503/jobs
+#   curl http://127.0.0.1:8503/jobs/<job_id>
+#   curl -o defisit.parquet "http://127.0.0.1:8503/jobs/<job_id>/defisit?format=parquet"
+
+API_WORKERS = int(os.environ.get('SO_API_WORKERS', '2'))
+# Maksimal job antri + berjalan; di atas ini POST /jobs dijawab 503
+API_MAX_QUEUE = int(os.environ.get('SO_API_MAX_QUEUE', '32'))
+# Job selesai/gagal yang hasilnya disimpan di memori (yang paling lama dibuang dulu)
+API_MAX_JOBS = int(os.environ.get('SO_API_MAX_JOBS', '64'))
+API_MAX_UPLOAD_BYTES = int(os.environ.get('SO_API_MAX_UPLOAD_MB', '200')) * 1024 ** 2
+
+RESULT_TABLES = ('defisit', 'substitusi', 'saran', 'antar_lokasi')
+RESULT_FORMATS = ('json', 'parquet')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SHA256 = re.compile(r'[0-9a-f]{64}')
+_JOB_PATH = re.compile(r'/jobs/([0-9a-f]+)(?:/([a-z_]+))?')
+
+_lock = threading.Lock()
+# job_id -> job (dict), urutan submit
+_jobs = {}
+_executor = None
+
+
+def start_workers(workers=API_WORKERS):
+    # Analisis berjalan di thread pool ini; file besar tetap memakai process
+    # pool partisi material dari locations.py
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-job')
+        return _executor
+
+
+def job_id(file_hash, params):
+    return hashlib.sha256(repr((file_hash, sorted(params.items()))).encode('utf-8')).hexdigest()[:16]
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat() if seconds else None
+
+
+def job_view(job):
+    view = {
+        'id': job['id'],
+        'status': job['status'],
+        'file_hash': job['file_hash'],
+        'params': job['params'],
+        'submitted': _timestamp(job['submitted']),
+        'started': _timestamp(job['started']),
+        'finished': _timestamp(job['finished']),
+        'error': job['error'],
+        'summary': job['summary'],
+    }
+    if job['status'] == DONE:
+        view['results'] = {name: f"/jobs/{job['id']}/{name}" for name in job['tables']}
+    return view
+
+
+def _evict():
+    # Dipanggil dengan _lock terpegang
+    finished = [key for key, job in _jobs.items() if job['status'] in (DONE, FAILED)]
+    for key in finished[:max(0, len(finished) - API_MAX_JOBS)]:
+        del _jobs[key]
+
+
+def _run_job(job, data):
+    with _lock:
+        job['status'] = RUNNING
+        job['started'] = time.time()
+    params = job['params']
+    try:
+        # data=None -> job dari referensi snapshot yang sudah ada di cache
+        df_so, df_loct, error_msg, _ = read_workbook_cached(
+            io.BytesIO(data) if data is not None else None, job['file_hash'],
+            number_format=params['number_format']
+        )
+        if error_msg:
+            raise ValueError(error_msg)
+
+        analysis = run_locations(df_so, df_loct, None, PRIORITY_OPTIONS[params['priority']], params['batch_order'])
+        log_stages(analysis['stages'], scope='api', job=job['id'], file=job['file_hash'][:12])
+        tables = build_location_report_tables(analysis)
+
+        summary = {
+            **analysis_summary(df_so, df_loct, analysis, tables['defisit']),
+            'seconds': analysis['seconds'],
+        }
+        with _lock:
+            job['tables'] = {name: tables[name] for name in RESULT_TABLES if name in tables}
+            job['summary'] = summary
+            job['status'] = DONE
+    except Exception as e:
+        with _lock:
+            job['error'] = f"{type(e).__name__}: {e}"
+            job['status'] = FAILED
+    finally:
+        with _lock:
+            job['finished'] = time.time()
+            _evict()
+
+
+def submit(file_hash, params, data=None):
+    # Hasil: (job, baru?) atau (None, False) bila antrian penuh.
+    # Job yang sama (hash + parameter) yang belum gagal dipakai ulang.
+    key = job_id(file_hash, params)
+    with _lock:
+        job = _jobs.get(key)
+        if job is not None and job['status'] != FAILED:
+            return job, False
+        if sum(job['status'] in (QUEUED, RUNNING) for job in _jobs.values()) >= API_MAX_QUEUE:
+            return None, False
+
+        _jobs.pop(key, None)
+        job = _jobs[key] = {
+            'id': key, 'status': QUEUED, 'file_hash': file_hash, 'params': params,
+            'submitted': time.time(), 'started': None, 'finished': None,
+            'error': None, 'summary': None, 'tables': None, 'payloads': {},
+        }
+    start_workers().submit(_run_job, job, data)
+    return job, True
+
+
+def get_job(key):
+    with _lock:
+        return _jobs.get(key)
+
+
+def queue_stats():
+    with _lock:
+        statuses = [job['status'] for job in _jobs.values()]
+    return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)}
+
+
+def table_payload(job, name, fmt):
+    # Serialisasi sekali per tabel + format; poller berikutnya memakai bytes yang sama
+    payload = job['payloads'].get((name, fmt))
+    if payload is None:
+        df = job['tables'][name]
+        if fmt == 'parquet':
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False)
+            payload = buffer.getvalue()
+        else:
+            records = df.to_json(orient='records', date_format='iso', force_ascii=False)
+            header = json.dumps({'job': job['id'], 'table': name, 'rows': len(df)})
+            payload = f'{header[:-1]}, "data": {records}}}'.encode('utf-8')
+        job['payloads'][(name, fmt)] = payload
+    return payload
+
+
+def parse_params(values):
+    # values: query string / body JSON; hasil: (params, pesan error)
+    params = {
+        'number_format': values.get('number_format', 'auto'),
+        'priority': values.get('priority', 'shipment'),
+        'batch_order': values.get('batch_order', 'Batch'),
+    }
+    # Nilai dari body JSON bisa bertipe apa saja (list, angka, null)
+    for name, value in params.items():
+        if not isinstance(value, str):
+            return None, f"{name} harus berupa teks"
+    if params['number_format'] not in NUMBER_FORMATS:
+        return None, f"number_format harus salah satu dari: {', '.join(NUMBER_FORMATS)}"
+    if params['priority'] not in PRIORITY_OPTIONS:
+        return None, f"priority harus salah satu dari: {', '.join(PRIORITY_OPTIONS)}"
+    if not params['batch_order']:
+        return None, "batch_order harus nama kolom di sheet Loct_*"
+    return params, None
+
+
+def _json_default(value):
+    # Angka numpy di summary
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8')
+        self._send(status, body, 'application/json; charset=utf-8', headers)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {'error': message}, headers)
+
+    def log_message(self, format, *args):
+        get_logger().info(json.dumps({
+            'event': 'request', 'ts': time.time(), 'client': self.client_address[0], 'message': format % args
+        }))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            self._send_json(HTTPStatus.OK, {'status': 'ok', 'jobs': queue_stats()})
+            return
+        if url.path == '/jobs':
+            with _lock:
+                jobs = list(_jobs.values())
+            self._send_json(HTTPStatus.OK, {'jobs': [job_view(job) for job in jobs]})
+            return
+
+        match = _JOB_PATH.fullmatch(url.path)
+        job = get_job(match.group(1)) if match else None
+        if job is None:
+            self._send_error(HTTPStatus.NOT_FOUND, "Job tidak ditemukan")
+            return
+        name = match.group(2)
+        if name is None:
+            self._send_json(HTTPStatus.OK, job_view(job))
+            return
+
+        if job['status'] != DONE:
+            self._send_error(HTTPStatus.CONFLICT, f"Job belum selesai (status: {job['status']})")
+            return
+        if name not in job['tables']:
+            self._send_error(HTTPStatus.NOT_FOUND, f"Tabel tersedia: {', '.join(job['tables'])}")
+            return
+        fmt = query.get('format', 'json')
+        if fmt not in RESULT_FORMATS:
+            self._send_error(HTTPStatus.BAD_REQUEST, f"format harus salah satu dari: {', '.join(RESULT_FORMATS)}")
+            return
+        content_type = MIME_TYPES['parquet'] if fmt == 'parquet' else 'application/json; charset=utf-8'
+        self._send(HTTPStatus.OK, table_payload(job, name, fmt), content_type)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/jobs':
+            self._send_error(HTTPStatus.NOT_FOUND, "Endpoint tidak ditemukan")
+            return
+        if 'Content-Length' not in self.headers:
+            self._send_error(HTTPStatus.LENGTH_REQUIRED, "Header Content-Length wajib diisi")
+            return
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Panjang body tidak diketahui: sisa request tidak bisa dipisahkan dari request berikutnya
+            self.close_connection = True
+            self._send_error(HTTPStatus.BAD_REQUEST, "Header Content-Length harus bilangan bulat >= 0")
+            return
+        if length > API_MAX_UPLOAD_BYTES:
+            # Body tidak dibaca; koneksi ditutup supaya sisa upload tidak terbaca sebagai request baru
+            self.close_connection = True
+            self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                             f"File lebih dari {API_MAX_UPLOAD_BYTES // 1024 ** 2} MB")
+            return
+        body = self.rfile.read(length)
+        values = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if self.headers.get_content_type() == 'application/json':
+            # Referensi snapshot: {"file_hash": "...", "number_format": ..., "priority": ..., "batch_order": ...}
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                payload = None
+            if not isinstance(payload, dict):
+                self._send_error(HTTPStatus.BAD_REQUEST, "Body JSON harus berupa object")
+                return
+            values.update(payload)
+            data = None
+            file_hash = str(values.get('file_hash', '')).lower()
+            if not _SHA256.fullmatch(file_hash):
+                self._send_error(HTTPStatus.BAD_REQUEST, "file_hash harus SHA-256 (hex) isi file xlsx")
+                return
+        else:
+            data = body
+            if not data.startswith(b'PK'):
+                self._send_error(HTTPStatus.BAD_REQUEST, "Body harus file .xlsx")
+                return
+            file_hash = hashlib.sha256(data).hexdigest()
+
+        params, error_msg = parse_params(values)
+        if error_msg:
+            self._send_error(HTTPStatus.BAD_REQUEST, error_msg)
+            return
+        if data is None and not has_snapshot(file_hash, params['number_format']):
+            self._send_error(HTTPStatus.NOT_FOUND, "Snapshot file ini belum ada di cache; kirim file xlsx-nya")
+            return
+
+        job, created = submit(file_hash, params, data)
+        if job is None:
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, "Antrian analisis penuh, coba lagi nanti",
+                             {'Retry-After': '5'})
+            return
+        status = HTTPStatus.ACCEPTED if created else HTTPStatus.OK
+        self._send_json(status, {**job_view(job), 'deduplicated': not created},
+                        {'Location': f"/jobs/{job['id']}"})
+
+
+class ApiServer(ThreadingHTTPServer):
+    # Satu thread per koneksi; request status/hasil tidak menunggu analisis
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_server(host='127.0.0.1', port=8503):
+    return ApiServer((host, port), ApiHandler)
+
+
+def main(argv=None):
+    global API_MAX_QUEUE
+    parser = argparse.ArgumentParser(description="HTTP API lokal untuk analisis defisit stock SO.")
+    parser.add_argument('--host', default='127.0.0.1', help="Alamat bind (default: 127.0.0.1, hanya lokal)")
+    parser.add_argument('--port', '-p', type=int, default=8503)
+    parser.add_argument('--workers', '-w', type=int, default=API_WORKERS, help="Jumlah job analisis bersamaan")
+    parser.add_argument('--max-queue', type=int, default=API_MAX_QUEUE, help="Maksimal job antri + berjalan")
+    args = parser.parse_args(argv)
+
+    API_MAX_QUEUE = args.max_queue
+    start_workers(args.workers)
+    server = make_server(args.host, args.port)
+    print(f"API berjalan di http://{args.host}:{server.server_address[1]} ({args.workers} worker)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
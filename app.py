@@ -1,155 +1,425 @@
 import streamlit as st
 import pandas as pd
-import io
+import numpy as np
+import hashlib
+import uuid
+
+from analysis import DETAIL_COLUMNS, SKU_DETAIL_COLUMNS, is_tanpa_batch, suggest_batches
+from export import (EXPORT_FORMATS, MIME_TYPES, SHEET_ANTAR_LOKASI, SHEET_DEFISIT, SHEET_DETAIL, SHEET_SARAN,
+                    SHEET_SKENARIO, SHEET_SKENARIO_SALDO, SHEET_SUBSTITUSI, cached_export, export_extension)
+from incremental import diff_deficits
+from ingest import EXPIRY_KEYWORDS
+from instrument import log_stages, stage
+from locations import run_locations
+from scenario import (affected_balances, apply_suggestions, assignment_digest, assignment_table, batch_labels,
+                      lines_for_material, material_batches, new_scenario, reassign, redo, reset, scenario_deficit,
+                      scenario_summary, suggested_codes, undo)
+from shared_store import acquire, register_session, retain, store_stats
+from sku_index import rows_for_material
+from snapshot_cache import read_workbook_cached
+from status import (CUKUP, DEFISIT, DEFISIT_BARU, DEFISIT_BERUBAH, DEFISIT_SELESAI, KURANG, PAS, STATUS_CATEGORIES,
+                    SURPLUS, TANPA_BATCH, TIDAK_ADA_STOCK, TOTAL_CUKUP, TOTAL_KURANG, classify_balance,
+                    classify_total_stock)
 
 # Konfigurasi Halaman
 st.set_page_config(page_title="Dashboard Analisis Defisit Stock SO - Mulyanto Demand Planner", layout="wide")
 
 st.title("📦 Dashboard Analisis Defisit Stock SO - Mulyanto Demand Planner ")
-st.markdown("Upload file Excel yang berisi sheet `SO_B2B` dan `Loct_F211`.")
-
-# --- FUNGSI CACHING ---
-@st.cache_data
-def load_data(file):
-    xls = pd.ExcelFile(file)
-    required_sheets = ['SO_B2B', 'Loct_F211']
-    missing_sheets = [s for s in required_sheets if s not in xls.sheet_names]
-    
-    if missing_sheets:
-        return None, None, f"Sheet hilang: {', '.join(missing_sheets)}"
-    
-    df_so = pd.read_excel(file, sheet_name='SO_B2B')
-    df_loct = pd.read_excel(file, sheet_name='Loct_F211')
-    
-    return df_so, df_loct, None
-
-def clean_number(x):
-    if isinstance(x, str):
-        x = x.replace(',', '') 
-    return pd.to_numeric(x, errors='coerce')
-
-# --- FUNGSI EXPORT EXCEL ---
-def to_excel(df_defisit, df_substitusi):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_defisit.to_excel(writer, index=False, sheet_name='Data Defisit (Action Needed)')
-        df_substitusi.to_excel(writer, index=False, sheet_name='Opsi Substitusi (Stock Tersedia)')
-    processed_data = output.getvalue()
-    return processed_data
-
-def to_excel_detail_so(df_detail):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_detail.to_excel(writer, index=False, sheet_name='Detail SKU per SO')
-    processed_data = output.getvalue()
-    return processed_data
-
-def to_excel_batch_suggestion(df_suggestion):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_suggestion.to_excel(writer, index=False, sheet_name='Saran Batch untuk SO Tanpa Batch')
-    processed_data = output.getvalue()
-    return processed_data
+st.markdown("Upload file Excel yang berisi sheet `SO_B2B` dan satu atau lebih sheet stock `Loct_*` (mis. `Loct_F211`).")
+
+# --- DATA BERSAMA ANTAR SESI ---
+# Hasil load dan analisis di-key dengan hash isi file + parameter dan disimpan
+# sekali per proses (shared_store.py): sesi lain yang membuka file yang sama
+# memakai objek yang sama tanpa copy, dan perubahan filter/selectbox hanya
+# memotong hasil yang sudah dihitung tanpa mengulang pipeline.
+def get_file_hash(file):
+    return hashlib.sha256(file.getvalue()).hexdigest()
+
+def load_data(key, session_id, file, file_hash, number_format):
+    # Workbook dibuka sekali (streaming read-only) dan hanya kolom yang dipakai yang dibaca;
+    # file yang sudah pernah diparsing dibaca dari snapshot Arrow di disk.
+    with st.spinner("Membaca file Excel..."):
+        return acquire(key, session_id, lambda: read_workbook_cached(file, file_hash, number_format=number_format))
+
+def analyze(key, session_id, df_so, df_loct, line_priority, batch_order, compact, previous=None):
+    # Per lokasi stock, partisi material di process pool; hanya material yang
+    # berubah dibanding upload sebelumnya yang dianalisis ulang
+    def build():
+        analysis = run_locations(df_so, df_loct, previous, line_priority, batch_order, compact)
+        # Tahap pipeline hanya dicatat saat benar-benar dihitung
+        log_stages(analysis['stages'], scope='pipeline', session=session_id, file=key[1][:12])
+        return analysis
+
+    with st.spinner("Menganalisis data..."):
+        return acquire(key, session_id, build)
+
+# --- FUNGSI DOWNLOAD (LAZY) ---
+# File baru dibuat saat tombol diklik (di thread terpisah) dan disimpan di disk
+# per hasil analisis + filter + format, jadi rerun biasa tidak membangun workbook.
+def lazy_download_button(label, key, sheet_names, build_tables, base_name, fmt, help=None):
+    ext = export_extension(sheet_names, fmt)
+    # Session id diambil di sini; build_file jalan di luar script run
+    session_id = st.session_state.get('session_id')
+
+    def build_file():
+        records = []
+        with stage(records, f'export_{base_name}') as record:
+            with open(cached_export(key, build_tables, fmt), 'rb') as f:
+                data = f.read()
+            record['rows_out'] = len(data)
+        log_stages(records, scope='export', session=session_id, format=ext)
+        return data
+
+    st.download_button(
+        label=f"{label} (.{ext})",
+        data=build_file,
+        file_name=f"{base_name}.{ext}",
+        mime=MIME_TYPES[ext],
+        help=help
+    )
 
 # --- FUNGSI COLOR CODING UNTUK STATUS ---
+STATUS_COLORS = {
+    DEFISIT: 'background-color: #ffcccc',
+    PAS: 'background-color: #ffffcc',
+    SURPLUS: 'background-color: #ccffcc',
+    TANPA_BATCH: 'background-color: #ffe6cc',
+    CUKUP: 'background-color: #ccffcc',
+    KURANG: 'background-color: #ffffcc',
+    TIDAK_ADA_STOCK: 'background-color: #ffcccc',
+    TOTAL_CUKUP: 'background-color: #ccffcc',
+    TOTAL_KURANG: 'background-color: #ffffcc',
+    DEFISIT_BARU: 'background-color: #ffcccc',
+    DEFISIT_BERUBAH: 'background-color: #ffffcc',
+    DEFISIT_SELESAI: 'background-color: #ccffcc',
+}
+
 def highlight_status(val):
-    if val == '❌ DEFISIT':
-        return 'background-color: #ffcccc'
-    elif val == '⚠️ PAS':
-        return 'background-color: #ffffcc'
-    elif val == '✅ SURPLUS':
-        return 'background-color: #ccffcc'
-    elif val == '⚠️ TANPA BATCH':
-        return 'background-color: #ffe6cc'
-    return ''
-
-def highlight_kecukupan(val):
-    if val == '✅ CUKUP':
-        return 'background-color: #ccffcc'
-    elif val == '⚠️ KURANG':
-        return 'background-color: #ffffcc'
-    elif val == '❌ TIDAK ADA STOCK':
-        return 'background-color: #ffcccc'
-    return ''
-
-def highlight_total_status(val):
-    if val == '✅ TOTAL STOCK CUKUP':
-        return 'background-color: #ccffcc'
-    elif val == '⚠️ TOTAL STOCK KURANG':
-        return 'background-color: #ffffcc'
-    return ''
+    return STATUS_COLORS.get(val, '')
+
+# --- TABEL DENGAN PAGINASI DI SERVER ---
+# Styler merender CSS dan string format untuk setiap sel, jadi tabel besar
+# dipotong per halaman di server: pencarian dan urutan dijalankan atas frame
+# asli, lalu hanya halaman yang terlihat yang di-style dan dikirim ke browser.
+PAGE_SIZES = [100, 500, 1000]
+ORIGINAL_ORDER = "(urutan asli)"
+
+def style_table(df, status_columns=(), formats=None):
+    styler = df.style
+    if status_columns:
+        styler = styler.map(highlight_status, subset=list(status_columns))
+    return styler.format(formats or {})
+
+def search_rows(df, query):
+    # Cocok bila teks ada di salah satu kolom non-angka (tanpa beda huruf besar/kecil)
+    mask = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        mask |= df[col].astype(str).str.contains(query, case=False, regex=False, na=False).to_numpy()
+    return df[mask]
+
+def show_table(df, key, status_columns=(), formats=None, hide_index=False):
+    # Tabel kecil langsung ditampilkan; tabel besar lewat pencarian/urut/halaman
+    if len(df) <= PAGE_SIZES[0]:
+        st.dataframe(style_table(df, status_columns, formats), use_container_width=True, hide_index=hide_index)
+        return
+
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    query = col1.text_input("Cari", key=f"{key}_cari", placeholder="Cari Material, Batch, Shipment...")
+    sort_by = col2.selectbox("Urutkan", [ORIGINAL_ORDER] + list(df.columns), key=f"{key}_urut")
+    descending = col3.checkbox("Menurun", key=f"{key}_turun")
+    page_size = col4.selectbox("Baris/halaman", PAGE_SIZES, key=f"{key}_ukuran")
+
+    if query:
+        df = search_rows(df, query)
+    if sort_by != ORIGINAL_ORDER:
+        df = df.sort_values(sort_by, ascending=not descending, kind='stable', na_position='last')
+
+    pages = max(1, -(-len(df) // page_size))
+    page_key = f"{key}_halaman"
+    # Halaman lama bisa di luar jangkauan setelah pencarian/filter berubah
+    if st.session_state.get(page_key, 1) > pages:
+        st.session_state[page_key] = 1
+    page = st.number_input(f"Halaman (dari {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+
+    start = (page - 1) * page_size
+    page_df = df.iloc[start:start + page_size]
+    st.dataframe(style_table(page_df, status_columns, formats), use_container_width=True, hide_index=hide_index)
+    st.caption(f"Baris {start + 1 if len(df) else 0:,}-{start + len(page_df):,} dari {len(df):,}")
+
+# --- PANEL DEBUG ---
+STAGE_COLUMNS = ['stage', 'rows_in', 'rows_out', 'seconds', 'rss_delta_mb', 'rss_mb']
+
+def show_debug_panel(pipeline_stages, app_stages):
+    with st.sidebar.expander("🐞 Waktu & Memori per Tahap", expanded=True):
+        st.caption("Dataset bersama di server")
+        st.dataframe(store_stats().style.format({"mb": "{:,.1f}"}, na_rep='-'), hide_index=True)
+        st.caption("Memori per tahap = perubahan RSS proses (ikut terpengaruh sesi lain yang sedang berjalan).")
+        for title, records in (("Pipeline analisis (saat dihitung)", pipeline_stages), ("Dashboard (rerun ini)", app_stages)):
+            if records:
+                st.caption(title)
+                stages_df = pd.DataFrame(records, columns=STAGE_COLUMNS).astype({'rows_in': 'Int64', 'rows_out': 'Int64'})
+                st.dataframe(stages_df.style.format({
+                    "seconds": "{:,.3f}",
+                    "rss_delta_mb": "{:+,.1f}",
+                    "rss_mb": "{:,.0f}"
+                }, na_rep='-'), hide_index=True)
+
+# --- SKENARIO WHAT-IF ---
+# Skenario disimpan per sesi (bukan di shared_store) karena bisa diedit.
+# Tab skenario adalah fragment: edit hanya me-rerun tab ini, bukan seluruh
+# dashboard, dan setiap edit hanya menghitung ulang batch yang terdampak.
+def get_scenario(scenario_key, result):
+    scenarios = st.session_state.setdefault('scenarios', {})
+    # Skenario file lain dibuang; lokasi/parameter lain di file yang sama tetap disimpan
+    for key in [k for k in scenarios if k[0] != scenario_key[0]]:
+        del scenarios[key]
+    if scenario_key not in scenarios:
+        scenarios[scenario_key] = new_scenario(result)
+    return scenarios[scenario_key]
+
+def run_scenario_action(scenario, action, *args):
+    # Callback tombol: dijalankan sebelum fragment dirender ulang
+    try:
+        outcome = action(scenario, *args)
+    except ValueError as e:
+        st.session_state['skenario_pesan'] = ('error', str(e))
+        return
+    if action in (undo, redo):
+        message = f"{'Undo' if action is undo else 'Redo'}: {outcome}" if outcome else None
+    else:
+        message = f"{outcome:,} line dipindah" if outcome else "Tidak ada line yang berubah"
+    st.session_state['skenario_pesan'] = ('info', message) if message else None
+
+def move_selected_lines(scenario, material, source_lines, line_key):
+    lines = source_lines if st.session_state.get('skenario_semua_line') else st.session_state.get(line_key, [])
+    batch = st.session_state['skenario_batch_tujuan']
+    run_scenario_action(scenario, reassign, lines, material, None if batch == TANPA_BATCH else batch)
+    st.session_state[line_key] = []
+
+@st.fragment
+def show_scenario(result, scenario_key, export_format):
+    scenario = get_scenario(scenario_key, result)
+    detail = result['detail']
+
+    summary = scenario_summary(scenario)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Batch Defisit", f"{summary['batch_defisit_skenario']:,}",
+                delta=summary['batch_defisit_skenario'] - summary['batch_defisit_awal'], delta_color='inverse')
+    col2.metric("Qty Defisit", f"{summary['qty_defisit_skenario']:,.0f}",
+                delta=f"{summary['qty_defisit_skenario'] - summary['qty_defisit_awal']:,.0f}", delta_color='inverse')
+    col3.metric("Line Dipindah", f"{summary['line_dipindah']:,}")
+
+    col1, col2, col3, col4 = st.columns(4)
+    suggested_lines, _ = suggested_codes(scenario, result['alokasi_tanpa_batch'])
+    col1.button(f"✨ Terapkan Saran Batch ({len(suggested_lines):,} line)", disabled=not len(suggested_lines),
+                on_click=run_scenario_action, args=(scenario, apply_suggestions, result['alokasi_tanpa_batch']),
+                help="Line tanpa batch diisi batch dengan alokasi terbesar dari tab 2")
+    col2.button("↩️ Undo", disabled=not scenario['undo'], on_click=run_scenario_action, args=(scenario, undo))
+    col3.button("↪️ Redo", disabled=not scenario['redo'], on_click=run_scenario_action, args=(scenario, redo))
+    col4.button("🔄 Reset", disabled=not summary['line_dipindah'], on_click=run_scenario_action, args=(scenario, reset))
+
+    message = st.session_state.pop('skenario_pesan', None)
+    if message:
+        getattr(st, message[0])(message[1])
+
+    st.markdown("**Pindahkan SO line ke batch lain**")
+    deficit_only = st.checkbox("Hanya material yang defisit di skenario", value=True, key='skenario_hanya_defisit')
+    if deficit_only:
+        materials = sorted(scenario_deficit(scenario)['Material'].unique())
+    else:
+        materials = sorted(scenario['line_offsets'])
+    if not materials:
+        st.success("Tidak ada material defisit di skenario ini.")
+    else:
+        col1, col2 = st.columns(2)
+        material = col1.selectbox("Material", materials, key='skenario_material')
+        batches_df = material_batches(scenario, material)
+        lines = lines_for_material(scenario, material)
+        current_batches = batch_labels(scenario, scenario['codes'][lines])
+        source_batch = col2.selectbox("Batch asal", sorted(set(current_batches.tolist())), key='skenario_batch_asal')
+        source_lines = lines[current_batches == source_batch]
+
+        show_table(batches_df, 'skenario_batch', status_columns=['Status'], formats={
+            "Stock": "{:,.0f}", "Qty_SO_Awal": "{:,.0f}", "Qty_SO": "{:,.0f}",
+            "Sisa_Stock_Awal": "{:,.0f}", "Sisa_Stock": "{:,.0f}"
+        }, hide_index=True)
+
+        # Pilihan line di-key per material + batch asal, jadi pilihan lama tidak terbawa
+        line_key = f"skenario_line|{material}|{source_batch}"
+        line_labels = dict(zip(source_lines.tolist(), (
+            f"{shipment} | qty {qty:,.0f} | baris {line + 1}"
+            for shipment, qty, line in zip(detail['Shipment Number'].iloc[source_lines],
+                                           scenario['line_qty'][source_lines], source_lines)
+        )))
+        col1, col2 = st.columns([3, 1])
+        select_all = col2.checkbox(f"Semua {len(source_lines):,} line", key='skenario_semua_line')
+        col1.multiselect("SO line", list(line_labels), key=line_key, disabled=select_all, format_func=line_labels.get)
+        targets = [batch for batch in batches_df['Batch'] if batch != source_batch]
+        if source_batch != TANPA_BATCH:
+            targets.append(TANPA_BATCH)
+        sisa = dict(zip(batches_df['Batch'], batches_df['Sisa_Stock']))
+        col1, col2 = st.columns([3, 1])
+        col1.selectbox(
+            "Batch tujuan", targets, key='skenario_batch_tujuan',
+            format_func=lambda batch: batch if batch == TANPA_BATCH else f"{batch} (sisa {sisa[batch]:,.0f})"
+        )
+        col2.button("➡️ Pindahkan", disabled=not targets, on_click=move_selected_lines,
+                    args=(scenario, material, source_lines, line_key))
+
+    affected_df = affected_balances(scenario)
+    if not affected_df.empty:
+        st.markdown("**Saldo batch terdampak**")
+        show_table(affected_df, 'skenario_saldo', status_columns=['Status'], formats={
+            "Stock": "{:,.0f}", "Qty_SO_Awal": "{:,.0f}", "Qty_SO": "{:,.0f}",
+            "Sisa_Stock_Awal": "{:,.0f}", "Sisa_Stock": "{:,.0f}"
+        }, hide_index=True)
+
+        lazy_download_button(
+            label="📥 Download Assignment Skenario",
+            key=scenario_key + ('skenario', assignment_digest(scenario)),
+            sheet_names=[SHEET_SKENARIO, SHEET_SKENARIO_SALDO],
+            build_tables=lambda: {
+                SHEET_SKENARIO: assignment_table(scenario, detail),
+                SHEET_SKENARIO_SALDO: affected_df,
+            },
+            base_name='Skenario_Pemindahan_Batch',
+            fmt=export_format,
+            help="Line = nomor baris data SO_B2B (tanpa header) dengan batch awal dan batch baru"
+        )
 
 # --- MAIN APP ---
 st.sidebar.header("Upload File")
 uploaded_file = st.sidebar.file_uploader("Upload File Excel (.xlsx)", type=['xlsx'])
+number_format_options = {
+    "Otomatis": 'auto',
+    "EN (1,234.5)": 'en',
+    "ID (1.234,5)": 'id',
+}
+selected_number_format = st.sidebar.selectbox(
+    "Format angka:",
+    list(number_format_options),
+    help="Pemisah ribuan/desimal untuk angka yang tersimpan sebagai teks di Excel"
+)
+debug_mode = st.sidebar.checkbox(
+    "🐞 Panel debug",
+    help="Tampilkan waktu, jumlah baris, dan perubahan memori (RSS) per tahap."
+)
+
+# Metrik per tahap rerun ini; juga dikirim sebagai log JSON (lihat instrument.py)
+session_id = st.session_state.setdefault('session_id', uuid.uuid4().hex[:12])
+register_session(st.session_state, session_id)
+# Dataset bersama yang dipegang sesi ini pada rerun ini; sisanya dilepas di akhir
+held_keys = []
+app_stages = []
 
 if uploaded_file:
-    df_so, df_loct, error_msg = load_data(uploaded_file)
+    file_hash = get_file_hash(uploaded_file)
+    number_format = number_format_options[selected_number_format]
+    load_key = ('load', file_hash, number_format)
+    held_keys.append(load_key)
+    with stage(app_stages, 'load') as record:
+        df_so, df_loct, error_msg, load_stats = load_data(load_key, session_id, uploaded_file, file_hash, number_format)
+        if df_so is not None and df_loct is not None:
+            record['rows_out'] = len(df_so) + len(df_loct)
+    
+    if load_stats:
+        with st.sidebar.expander("⏱️ Statistik Load File"):
+            for sheet_name, stat in load_stats.items():
+                rss = f", RSS {stat['rss_delta_mb']:+,.1f} MB" if stat['rss_delta_mb'] is not None else ""
+                st.caption(f"`{sheet_name}` ({stat['source']}): {stat['rows']:,} baris, {stat['seconds']:.2f} detik{rss}")
+
+        # Angka teks yang tidak bisa diparsing dilaporkan, bukan diam-diam jadi kosong
+        for sheet_name, stat in load_stats.items():
+            for report in stat['parse']:
+                if report['coerced']:
+                    samples = ", ".join(f"baris {s['row']}: `{s['value']}`" for s in report['sample'])
+                    st.warning(
+                        f"{report['coerced']:,} nilai di kolom `{report['column']}` (sheet `{sheet_name}`) "
+                        f"tidak bisa dibaca sebagai angka dan dianggap kosong. Contoh: {samples}"
+                    )
     
     if error_msg:
         st.error(error_msg)
     elif df_so is not None and df_loct is not None:
+        # Prioritas alokasi stock antar SO line (FIFO per batch / FEFO bila ada kolom expiry)
+        st.sidebar.header("Prioritas Alokasi")
+        priority_options = {
+            "Shipment Number": ('Shipment Number',),
+            "Urutan baris di file": (),
+        }
+        selected_priority = st.sidebar.selectbox("Urutan SO line:", list(priority_options))
+        batch_order_options = ['Batch'] + [
+            col for col in df_loct.columns
+            if any(key in str(col).lower() for key in EXPIRY_KEYWORDS)
+        ]
+        batch_order = st.sidebar.selectbox(
+            "Urutan batch:",
+            batch_order_options,
+            help="'Batch' = FIFO berdasarkan nomor batch, kolom tanggal expiry = FEFO"
+        )
+
+        export_format = st.sidebar.selectbox(
+            "Format download:",
+            EXPORT_FORMATS,
+            help="xlsx untuk dibuka di Excel; csv/parquet jauh lebih cepat untuk data besar"
+        )
+        compact_mode = st.sidebar.checkbox(
+            "Mode hemat memori (compact)",
+            help="Material/Batch/Shipment disimpan sebagai kategori, angka di-downcast, batch kosong tetap null"
+        )
+        # Format angka ikut di key: qty hasil parsing (dan semua export/skenario) bergantung padanya
+        analysis_key = (file_hash, number_format, priority_options[selected_priority], batch_order, compact_mode)
+        store_key = ('analysis',) + analysis_key
+
+        # Hasil upload sebelumnya (file lain) disimpan per sesi untuk analisis inkremental dan diff
+        current_analysis = st.session_state.get('current_analysis')
+        if current_analysis is not None and current_analysis['file_hash'] != file_hash:
+            st.session_state['previous_analysis'] = current_analysis
+        previous_analysis = st.session_state.get('previous_analysis')
+        if previous_analysis is not None:
+            held_keys.append(previous_analysis['key'])
+        held_keys.append(store_key)
+
         try:
-            # --- PREPROCESSING ---
-            df_so['Material'] = df_so['Material'].astype(str)
-            df_loct['Material'] = df_loct['Material'].astype(str)
-            
-            if df_so['Ordered Quantity'].dtype == 'object':
-                df_so['Ordered Quantity'] = df_so['Ordered Quantity'].apply(clean_number)
-            
-            if df_loct['Unrestricted'].dtype == 'object':
-                df_loct['Unrestricted'] = df_loct['Unrestricted'].apply(clean_number)
-
-            # Cek nama kolom Batch di df_so
-            if 'Batch Number' not in df_so.columns:
-                batch_col = [col for col in df_so.columns if 'batch' in col.lower()]
-                if batch_col:
-                    batch_col_name = batch_col[0]
-                    df_so.rename(columns={batch_col_name: 'Batch Number'}, inplace=True)
-                else:
-                    st.error("Kolom 'Batch Number' tidak ditemukan di sheet SO_B2B")
-                    st.stop()
-
-            # Buat dataframe detail dengan status stock
-            loct_batch = df_loct.groupby(['Material', 'Batch'])['Unrestricted'].sum().reset_index()
-            loct_batch.rename(columns={'Unrestricted': 'Stock_Batch'}, inplace=True)
-            
-            # Merge dengan penanganan khusus untuk NaN di Batch Number
-            df_so_detail = df_so.copy()
-            df_so_detail['Batch Number'] = df_so_detail['Batch Number'].fillna('TANPA BATCH')
-            
-            df_so_detail = df_so_detail.merge(
-                loct_batch, 
-                left_on=['Material', 'Batch Number'], 
-                right_on=['Material', 'Batch'], 
-                how='left'
-            )
-            df_so_detail.drop('Batch_y', axis=1, errors='ignore', inplace=True)
-            df_so_detail.rename(columns={'Batch_x': 'Batch Number'}, inplace=True, errors='ignore')
-            
-            df_so_detail['Stock_Batch'] = df_so_detail['Stock_Batch'].fillna(0)
-            df_so_detail['Balance_Per_Line'] = df_so_detail['Stock_Batch'] - df_so_detail['Ordered Quantity']
-            
-            # Tambah kolom Status
-            def get_status_detail(row):
-                if row['Batch Number'] == 'TANPA BATCH':
-                    return "⚠️ TANPA BATCH"
-                elif row['Balance_Per_Line'] < 0:
-                    return "❌ DEFISIT"
-                elif row['Balance_Per_Line'] == 0:
-                    return "⚠️ PAS"
-                else:
-                    return "✅ SURPLUS"
-            
-            df_so_detail['Status_Stock'] = df_so_detail.apply(get_status_detail, axis=1)
-            
-            # Tambah kolom global stock per material
-            loct_material = df_loct.groupby('Material')['Unrestricted'].sum().reset_index()
-            loct_material.rename(columns={'Unrestricted': 'Total_Stock_Material'}, inplace=True)
-            df_so_detail = df_so_detail.merge(loct_material, on='Material', how='left')
-            df_so_detail['Total_Stock_Material'] = df_so_detail['Total_Stock_Material'].fillna(0)
-
-            tab1, tab2, tab3 = st.tabs(["🚨 Analisis Defisit & Download", "📋 Detail SKU per SO", "🔍 Cek Detail per SKU"])
+            try:
+                with stage(app_stages, 'analysis', rows_in=len(df_so) + len(df_loct)) as record:
+                    analysis = analyze(
+                        store_key, session_id, df_so, df_loct, priority_options[selected_priority], batch_order,
+                        compact_mode, previous=previous_analysis['result'] if previous_analysis else None
+                    )
+                    record['rows_out'] = sum(len(result['detail']) for result in analysis['locations'].values())
+            except ValueError as e:
+                st.error(str(e))
+                retain(session_id, held_keys)
+                st.stop()
+            st.session_state['current_analysis'] = {'file_hash': file_hash, 'key': store_key, 'result': analysis}
+
+            # Tab 1-4 menampilkan satu lokasi; tab Antar Lokasi membandingkan semua lokasi
+            location_options = list(analysis['locations'])
+            selected_location = location_options[0]
+            if len(location_options) > 1:
+                selected_location = st.sidebar.selectbox("Lokasi stock:", location_options)
+            result = analysis['locations'][selected_location]
+            analysis_key = analysis_key + (selected_location,)
+
+            df_so = result['so']
+            df_loct = result['loct']
+            df_so_detail = result['detail']
+
+            if result['memory'] is not None:
+                with st.sidebar.expander("🧠 Memori Data (Sebelum vs Sesudah Compact)"):
+                    st.dataframe(result['memory'].style.format({
+                        "Sebelum_MB": "{:,.2f}",
+                        "Sesudah_MB": "{:,.2f}",
+                        "Rasio": "{:,.1f}x"
+                    }), hide_index=True)
+
+            tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+                "🚨 Analisis Defisit & Download", "📋 Detail SKU per SO", "🔍 Cek Detail per SKU", "🔄 Perubahan",
+                "🌐 Antar Lokasi", "🧪 Skenario"
+            ])
 
             # =========================================
             # TAB 1: HASIL ANALISIS & DOWNLOAD
@@ -157,94 +427,40 @@ if uploaded_file:
             with tab1:
                 st.subheader("Analisis Batch Defisit")
                 
-                # Filter SO yang memiliki batch number saja untuk analisis defisit
-                df_so_with_batch = df_so[df_so['Batch Number'].notna()].copy()
-                
-                if not df_so_with_batch.empty:
-                    so_agg = df_so_with_batch.groupby(['Material', 'Batch Number']).agg({
-                        'Ordered Quantity': 'sum',
-                        'Shipment Number': lambda x: ', '.join(x.astype(str).unique()) 
-                    }).reset_index()
-                    
-                    so_agg.rename(columns={
-                        'Batch Number': 'Batch', 
-                        'Ordered Quantity': 'Total_Ordered',
-                        'Shipment Number': 'List_Shipment_Numbers'
-                    }, inplace=True)
-                    
-                    loct_agg = df_loct.groupby(['Material', 'Batch'])['Unrestricted'].sum().reset_index()
-                    loct_agg.rename(columns={'Unrestricted': 'Stock_Onhand'}, inplace=True)
-                    
-                    merged_df = pd.merge(so_agg, loct_agg, on=['Material', 'Batch'], how='left')
-                    merged_df['Stock_Onhand'] = merged_df['Stock_Onhand'].fillna(0)
-                    merged_df['Balance'] = merged_df['Stock_Onhand'] - merged_df['Total_Ordered']
-                    
-                    deficit_df = merged_df[merged_df['Balance'] < 0].copy()
+                if result['has_batch']:
+                    deficit_df_clean = result['deficit']
                     
-                    if not deficit_df.empty:
-                        cols = ['Material', 'Batch', 'Total_Ordered', 'Stock_Onhand', 'Balance', 'List_Shipment_Numbers']
-                        deficit_df_clean = deficit_df[cols]
-
+                    if not deficit_df_clean.empty:
                         st.error(f"Ditemukan {len(deficit_df_clean)} Batch SKU yang defisit!")
-                        st.dataframe(deficit_df_clean.style.format({
-                            "Total_Ordered": "{:,.0f}", 
-                            "Stock_Onhand": "{:,.0f}", 
-                            "Balance": "{:,.0f}"
-                        }), use_container_width=True)
-
-                        list_material_defisit = deficit_df['Material'].unique()
-                        
-                        loct_subset = df_loct[df_loct['Material'].isin(list_material_defisit)]
-                        loct_avail = loct_subset.groupby(['Material', 'Batch'])['Unrestricted'].sum().reset_index()
-                        loct_avail.rename(columns={'Unrestricted': 'Stock_Gudang'}, inplace=True)
-                        
-                        so_subset = df_so_with_batch[df_so_with_batch['Material'].isin(list_material_defisit)]
-                        so_avail = so_subset.groupby(['Material', 'Batch Number'])['Ordered Quantity'].sum().reset_index()
-                        so_avail.rename(columns={'Batch Number': 'Batch', 'Ordered Quantity': 'Qty_SO_Terpakai'}, inplace=True)
-                        
-                        substitusi_df = pd.merge(loct_avail, so_avail, on=['Material', 'Batch'], how='outer')
-                        substitusi_df['Stock_Gudang'] = substitusi_df['Stock_Gudang'].fillna(0)
-                        substitusi_df['Qty_SO_Terpakai'] = substitusi_df['Qty_SO_Terpakai'].fillna(0)
-                        substitusi_df['Sisa_Stock_Bisa_Pakai'] = substitusi_df['Stock_Gudang'] - substitusi_df['Qty_SO_Terpakai']
-                        
-                        def get_status(row):
-                            if row['Sisa_Stock_Bisa_Pakai'] < 0:
-                                return "❌ DEFISIT"
-                            elif row['Sisa_Stock_Bisa_Pakai'] == 0:
-                                return "⚠️ PAS"
-                            else:
-                                return "✅ SURPLUS"
-                        
-                        substitusi_df['Status'] = substitusi_df.apply(get_status, axis=1)
-                        
-                        status_order = {"❌ DEFISIT": 1, "⚠️ PAS": 2, "✅ SURPLUS": 3}
-                        substitusi_df['Sort_Status'] = substitusi_df['Status'].map(status_order)
-                        substitusi_df = substitusi_df.sort_values(
-                            by=['Material', 'Sort_Status', 'Sisa_Stock_Bisa_Pakai'], 
-                            ascending=[True, True, True]
-                        ).drop('Sort_Status', axis=1)
-
-                        with st.expander("📊 Lihat Preview Opsi Substitusi (Semua Batch Material Terkait)"):
-                            st.caption("Tabel ini menampilkan semua batch dari material yang defisit.")
-                            
-                            styled_df = substitusi_df.style.map(
-                                highlight_status, 
-                                subset=['Status']
-                            ).format({
-                                "Stock_Gudang": "{:,.0f}",
-                                "Qty_SO_Terpakai": "{:,.0f}",
-                                "Sisa_Stock_Bisa_Pakai": "{:,.0f}"
+                        with stage(app_stages, 'tab1_deficit', rows_in=len(deficit_df_clean)):
+                            show_table(deficit_df_clean, 'defisit', formats={
+                                "Total_Ordered": "{:,.0f}",
+                                "Stock_Onhand": "{:,.0f}",
+                                "Balance": "{:,.0f}"
                             })
-                            
-                            st.dataframe(styled_df, use_container_width=True)
 
-                        excel_data = to_excel(deficit_df_clean, substitusi_df)
-                        
-                        st.download_button(
-                            label="📥 Download Report Lengkap (.xlsx)",
-                            data=excel_data,
-                            file_name='Laporan_Analisis_Stock_Defisit.xlsx',
-                            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                        substitusi_df = result['substitusi']
+
+                        with stage(app_stages, 'tab1_substitution', rows_in=len(substitusi_df)):
+                            with st.expander("📊 Lihat Preview Opsi Substitusi (Semua Batch Material Terkait)"):
+                                st.caption("Tabel ini menampilkan semua batch dari material yang defisit.")
+
+                                show_table(substitusi_df, 'substitusi', status_columns=['Status'], formats={
+                                    "Stock_Gudang": "{:,.0f}",
+                                    "Qty_SO_Terpakai": "{:,.0f}",
+                                    "Sisa_Stock_Bisa_Pakai": "{:,.0f}"
+                                })
+
+                        lazy_download_button(
+                            label="📥 Download Report Lengkap",
+                            key=analysis_key + ('report',),
+                            sheet_names=[SHEET_DEFISIT, SHEET_SUBSTITUSI],
+                            build_tables=lambda: {
+                                SHEET_DEFISIT: deficit_df_clean,
+                                SHEET_SUBSTITUSI: substitusi_df
+                            },
+                            base_name='Laporan_Analisis_Stock_Defisit',
+                            fmt=export_format
                         )
                         
                     else:
@@ -272,26 +488,28 @@ if uploaded_file:
                 with col2:
                     status_filter = st.multiselect(
                         "Filter Status Stock:",
-                        options=["❌ DEFISIT", "⚠️ PAS", "✅ SURPLUS", "⚠️ TANPA BATCH"],
-                        default=["❌ DEFISIT", "⚠️ TANPA BATCH"],
+                        options=STATUS_CATEGORIES,
+                        default=[DEFISIT, TANPA_BATCH],
                         help="Pilih status stock yang ingin ditampilkan"
                     )
                 
-                # Filter data berdasarkan pilihan
-                if selected_so:
-                    df_filtered = df_so_detail[df_so_detail['Shipment Number'].isin(selected_so)].copy()
-                else:
-                    df_filtered = df_so_detail.copy()
-                
-                if status_filter:
-                    df_filtered = df_filtered[df_filtered['Status_Stock'].isin(status_filter)]
+                with stage(app_stages, 'tab2_filter', rows_in=len(df_so_detail)) as record:
+                    # Filter data berdasarkan pilihan (mask per posisi baris detail)
+                    # Tanpa .copy(): frame bersama read-only (copy-on-write), filter membuat frame baru
+                    mask = np.ones(len(df_so_detail), dtype=bool)
+                    if selected_so:
+                        mask &= df_so_detail['Shipment Number'].isin(selected_so).to_numpy()
+                    if status_filter:
+                        mask &= df_so_detail['Status_Stock'].isin(status_filter).to_numpy()
+                    df_filtered = df_so_detail[mask]
+                    record['rows_out'] = len(df_filtered)
                 
                 if not df_filtered.empty:
                     # Tampilkan ringkasan
                     total_lines = len(df_filtered)
                     total_qty = df_filtered['Ordered Quantity'].sum()
-                    deficit_lines = len(df_filtered[df_filtered['Status_Stock'] == '❌ DEFISIT'])
-                    tanpa_batch_lines = len(df_filtered[df_filtered['Status_Stock'] == '⚠️ TANPA BATCH'])
+                    deficit_lines = len(df_filtered[df_filtered['Status_Stock'] == DEFISIT])
+                    tanpa_batch_lines = len(df_filtered[df_filtered['Status_Stock'] == TANPA_BATCH])
                     
                     col1, col2, col3, col4 = st.columns(4)
                     col1.metric("Total Line Items", total_lines)
@@ -299,172 +517,107 @@ if uploaded_file:
                     col3.metric("Line Defisit", deficit_lines)
                     col4.metric("Tanpa Batch", tanpa_batch_lines)
                     
-                    # Siapkan kolom yang ingin ditampilkan
-                    cols_display = [
-                        'Shipment Number', 
-                        'Material', 
-                        'Batch Number', 
-                        'Ordered Quantity',
-                        'Stock_Batch',
-                        'Balance_Per_Line',
-                        'Total_Stock_Material',
-                        'Status_Stock'
-                    ]
-                    
-                    df_display = df_filtered[cols_display].copy()
-                    df_display = df_display.sort_values(['Shipment Number', 'Status_Stock', 'Material'])
-                    
-                    # Tampilkan tabel dengan styling
-                    styled_detail = df_display.style.map(
-                        highlight_status,
-                        subset=['Status_Stock']
-                    ).format({
-                        "Ordered Quantity": "{:,.0f}",
-                        "Stock_Batch": "{:,.0f}",
-                        "Balance_Per_Line": "{:,.0f}",
-                        "Total_Stock_Material": "{:,.0f}"
-                    })
+                    with stage(app_stages, 'tab2_styling', rows_in=len(df_filtered)):
+                        # Siapkan kolom yang ingin ditampilkan
+                        # Urutan Shipment/Status/Material sudah dihitung sekali per analisis
+                        order = result['detail_order']
+                        df_display = df_so_detail.iloc[order[mask[order]]][DETAIL_COLUMNS]
                     
-                    st.dataframe(styled_detail, use_container_width=True)
+                        # Tampilkan tabel dengan styling (hanya halaman yang terlihat)
+                        show_table(df_display, 'detail', status_columns=['Status_Stock', 'Status_Alokasi'], formats={
+                            "Ordered Quantity": "{:,.0f}",
+                            "Stock_Batch": "{:,.0f}",
+                            "Balance_Per_Line": "{:,.0f}",
+                            "Total_Stock_Material": "{:,.0f}",
+                            "Qty_Alokasi": "{:,.0f}",
+                            "Sisa_Stock_Alokasi": "{:,.0f}",
+                            "Kekurangan_Alokasi": "{:,.0f}"
+                        })
                     
                     # Download button untuk data yang difilter
-                    st.download_button(
-                        label="📥 Download Detail SKU (Filtered).xlsx",
-                        data=to_excel_detail_so(df_display),
-                        file_name=f'Detail_SKU_SO_{len(df_display)}_items.xlsx',
-                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    filter_key = (tuple(selected_so), tuple(status_filter))
+                    lazy_download_button(
+                        label="📥 Download Detail SKU (Filtered)",
+                        key=analysis_key + ('detail',) + filter_key,
+                        sheet_names=[SHEET_DETAIL],
+                        build_tables=lambda: {SHEET_DETAIL: df_display},
+                        base_name=f'Detail_SKU_SO_{len(df_display)}_items',
+                        fmt=export_format
                     )
                     
                     # ===== FITUR BARU: SARAN BATCH UNTUK SO TANPA BATCH =====
                     # Ambil data SO yang tidak memiliki batch number dari hasil filter
-                    df_tanpa_batch = df_filtered[df_filtered['Batch Number'] == 'TANPA BATCH'].copy()
+                    df_tanpa_batch = df_filtered[is_tanpa_batch(df_filtered['Batch Number'])]
                     
                     if not df_tanpa_batch.empty:
                         st.markdown("---")
                         st.subheader("🎯 Saran Batch untuk SO yang Belum Ada Batch Number")
                         st.caption("Berikut adalah rekomendasi batch yang available di F211 untuk material yang belum ditentukan batchnya.")
                         
-                        # Buat list saran batch
-                        list_saran = []
-                        
-                        for idx, row in df_tanpa_batch.iterrows():
-                            material = row['Material']
-                            qty_needed = row['Ordered Quantity']
-                            so_number = row['Shipment Number']
-                            
-                            # Ambil batch yang available untuk material tersebut
-                            batch_available = df_loct[
-                                (df_loct['Material'] == material) & 
-                                (df_loct['Unrestricted'] > 0)
-                            ].groupby('Batch')['Unrestricted'].sum().reset_index()
-                            
-                            if not batch_available.empty:
-                                # Hitung total stock available
-                                batch_available['Stock_Available'] = batch_available['Unrestricted']
-                                batch_available['Qty_Dibutuhkan'] = qty_needed
-                                batch_available['Shipment_Number'] = so_number
-                                batch_available['Material'] = material
-                                batch_available['Status_Kecukupan'] = batch_available['Stock_Available'].apply(
-                                    lambda x: '✅ CUKUP' if x >= qty_needed else '⚠️ KURANG'
-                                )
-                                
-                                batch_available = batch_available[[
-                                    'Shipment_Number', 'Material', 'Batch', 'Stock_Available', 
-                                    'Qty_Dibutuhkan', 'Status_Kecukupan'
-                                ]]
-                                
-                                list_saran.append(batch_available)
-                            else:
-                                # Jika tidak ada stock sama sekali
-                                no_stock_row = pd.DataFrame([{
-                                    'Shipment_Number': so_number,
-                                    'Material': material,
-                                    'Batch': 'TIDAK ADA STOCK',
-                                    'Stock_Available': 0,
-                                    'Qty_Dibutuhkan': qty_needed,
-                                    'Status_Kecukupan': '❌ TIDAK ADA STOCK'
-                                }])
-                                list_saran.append(no_stock_row)
+                        with stage(app_stages, 'tab2_suggestions', rows_in=len(df_tanpa_batch)) as record:
+                            df_saran = suggest_batches(df_tanpa_batch, result['cube'], result['alokasi_tanpa_batch'])
+                            record['rows_out'] = len(df_saran)
                         
-                        if list_saran:
-                            df_saran = pd.concat(list_saran, ignore_index=True)
-                            
-                            # Tampilkan tabel saran - GUNAKAN .map() BUKAN .applymap()
-                            styled_saran = df_saran.style.map(
-                                highlight_kecukupan,
-                                subset=['Status_Kecukupan']
-                            ).format({
-                                "Stock_Available": "{:,.0f}",
-                                "Qty_Dibutuhkan": "{:,.0f}"
-                            })
-                            
-                            st.dataframe(styled_saran, use_container_width=True)
+                        if not df_saran.empty:
+                            with stage(app_stages, 'tab2_suggestions_styling', rows_in=len(df_saran)):
+                                # Tampilkan tabel saran
+                                show_table(df_saran, 'saran', status_columns=['Status_Kecukupan'], formats={
+                                    "Stock_Available": "{:,.0f}",
+                                    "Qty_Dibutuhkan": "{:,.0f}",
+                                    "Qty_Alokasi": "{:,.0f}"
+                                })
                             
                             # Download button untuk saran batch
-                            st.download_button(
-                                label="📥 Download Saran Batch untuk SO Tanpa Batch.xlsx",
-                                data=to_excel_batch_suggestion(df_saran),
-                                file_name=f'Saran_Batch_SO_Tanpa_Batch_{len(df_saran)}_items.xlsx',
-                                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                            lazy_download_button(
+                                label="📥 Download Saran Batch untuk SO Tanpa Batch",
+                                key=analysis_key + ('saran',) + filter_key,
+                                sheet_names=[SHEET_SARAN],
+                                build_tables=lambda: {SHEET_SARAN: df_saran},
+                                base_name=f'Saran_Batch_SO_Tanpa_Batch_{len(df_saran)}_items',
+                                fmt=export_format,
                                 help="Download rekomendasi batch untuk SO yang belum memiliki batch number"
                             )
                             
                             # Ringkasan per SO
                             with st.expander("📊 Lihat Ringkasan per SO (Tanpa Batch)"):
-                                summary_so = df_saran.groupby(['Shipment_Number', 'Material']).agg({
+                                summary_so = df_saran.groupby(['Shipment_Number', 'Material'], observed=True).agg({
                                     'Qty_Dibutuhkan': 'first',
                                     'Batch': lambda x: ', '.join(x.unique()),
-                                    'Stock_Available': 'sum'
+                                    'Stock_Available': 'sum',
+                                    'Qty_Alokasi': 'sum'
                                 }).reset_index()
                                 
-                                summary_so['Status'] = summary_so.apply(
-                                    lambda row: '✅ TOTAL STOCK CUKUP' if row['Stock_Available'] >= row['Qty_Dibutuhkan'] 
-                                    else '⚠️ TOTAL STOCK KURANG', axis=1
+                                summary_so['Status'] = classify_total_stock(
+                                    summary_so['Stock_Available'],
+                                    summary_so['Qty_Dibutuhkan']
                                 )
                                 
-                                styled_summary = summary_so.style.map(
-                                    highlight_total_status,
-                                    subset=['Status']
-                                ).format({
+                                show_table(summary_so, 'ringkasan_so', status_columns=['Status'], formats={
                                     "Qty_Dibutuhkan": "{:,.0f}",
-                                    "Stock_Available": "{:,.0f}"
+                                    "Stock_Available": "{:,.0f}",
+                                    "Qty_Alokasi": "{:,.0f}"
                                 })
-                                
-                                st.dataframe(styled_summary, use_container_width=True)
                     
                     # Summary per Material (untuk semua data)
                     with st.expander("📊 Lihat Summary per Material"):
-                        summary = df_filtered.groupby('Material').agg({
+                        summary = df_filtered.groupby('Material', observed=True).agg({
                             'Ordered Quantity': 'sum',
                             'Shipment Number': lambda x: ', '.join(x.unique())
                         }).reset_index()
                         summary.columns = ['Material', 'Total_Qty_SO', 'List_SO']
                         
-                        stock_summary = df_filtered.groupby('Material')['Total_Stock_Material'].first().reset_index()
+                        stock_summary = df_filtered.groupby('Material', observed=True)['Total_Stock_Material'].first().reset_index()
                         summary = summary.merge(stock_summary, on='Material')
                         summary['Balance_Global'] = summary['Total_Stock_Material'] - summary['Total_Qty_SO']
                         
-                        def get_status_summary(row):
-                            if row['Balance_Global'] < 0:
-                                return "❌ DEFISIT"
-                            elif row['Balance_Global'] == 0:
-                                return "⚠️ PAS"
-                            else:
-                                return "✅ SURPLUS"
-                        
-                        summary['Status_Global'] = summary.apply(get_status_summary, axis=1)
+                        summary['Status_Global'] = classify_balance(summary['Balance_Global'])
                         
-                        styled_summary = summary.style.map(
-                            highlight_status,
-                            subset=['Status_Global']
-                        ).format({
+                        show_table(summary, 'ringkasan_material', status_columns=['Status_Global'], formats={
                             "Total_Qty_SO": "{:,.0f}",
                             "Total_Stock_Material": "{:,.0f}",
                             "Balance_Global": "{:,.0f}"
                         })
                         
-                        st.dataframe(styled_summary, use_container_width=True)
-                        
                 else:
                     st.warning("Tidak ada data yang sesuai dengan filter yang dipilih.")
 
@@ -474,32 +627,17 @@ if uploaded_file:
             with tab3:
                 st.subheader("Cek Ketersediaan & Alokasi Stock per SKU")
                 
-                all_materials = sorted(df_loct['Material'].unique())
-                selected_material = st.selectbox("Pilih Material / SKU:", all_materials)
+                selected_material = st.selectbox("Pilih Material / SKU:", result['materials'])
                 
                 if selected_material:
-                    loct_subset = df_loct[df_loct['Material'] == selected_material]
-                    loct_grouped = loct_subset.groupby(['Material', 'Batch'])['Unrestricted'].sum().reset_index()
-                    loct_grouped.rename(columns={'Unrestricted': 'Stock_Gudang'}, inplace=True)
-                    
-                    so_subset = df_so[df_so['Material'] == selected_material]
-                    so_grouped = so_subset.groupby(['Material', 'Batch Number'])['Ordered Quantity'].sum().reset_index()
-                    so_grouped.rename(columns={'Batch Number': 'Batch', 'Ordered Quantity': 'Qty_SO'}, inplace=True)
-                    
-                    final_view = pd.merge(loct_grouped, so_grouped, on=['Material', 'Batch'], how='outer')
-                    final_view['Stock_Gudang'] = final_view['Stock_Gudang'].fillna(0)
-                    final_view['Qty_SO'] = final_view['Qty_SO'].fillna(0)
-                    final_view['Sisa_Stock'] = final_view['Stock_Gudang'] - final_view['Qty_SO']
-                    
-                    def get_status_final(row):
-                        if row['Sisa_Stock'] < 0:
-                            return "❌ DEFISIT"
-                        elif row['Sisa_Stock'] == 0:
-                            return "⚠️ PAS"
-                        else:
-                            return "✅ SURPLUS"
+                    with stage(app_stages, 'tab3_lookup') as record:
+                        # Lookup lewat index per SKU (hanya baris material ini yang disentuh)
+                        final_view = rows_for_material(result['sku_stock'], selected_material).rename(
+                            columns={'Stock': 'Stock_Gudang'}
+                        )
+                        record['rows_out'] = len(final_view)
                     
-                    final_view['Status'] = final_view.apply(get_status_final, axis=1)
+                    final_view['Status'] = classify_balance(final_view['Sisa_Stock'])
                     
                     tot_stock = final_view['Stock_Gudang'].sum()
                     tot_so = final_view['Qty_SO'].sum()
@@ -509,32 +647,107 @@ if uploaded_file:
                     col2.metric("Total Order", f"{tot_so:,.0f}")
                     col3.metric("Balance Global", f"{tot_stock - tot_so:,.0f}")
                     
-                    styled_final = final_view.style.map(
-                        highlight_status,
-                        subset=['Status']
-                    ).format({
-                        "Stock_Gudang": "{:,.0f}", 
-                        "Qty_SO": "{:,.0f}", 
-                        "Sisa_Stock": "{:,.0f}"
-                    })
-                    
-                    st.dataframe(styled_final, use_container_width=True)
+                    with stage(app_stages, 'tab3_styling', rows_in=len(final_view)):
+                        show_table(final_view, 'stock_sku', status_columns=['Status'], formats={
+                            "Stock_Gudang": "{:,.0f}",
+                            "Qty_SO": "{:,.0f}",
+                            "Sisa_Stock": "{:,.0f}"
+                        })
                     
                     with st.expander("📋 Lihat Detail SO untuk Material ini"):
-                        detail_material = df_so_detail[df_so_detail['Material'] == selected_material][
-                            ['Shipment Number', 'Batch Number', 'Ordered Quantity', 'Stock_Batch', 'Balance_Per_Line', 'Status_Stock']
-                        ].sort_values('Shipment Number')
+                        detail_material = rows_for_material(result['sku_detail'], selected_material)[SKU_DETAIL_COLUMNS]
                         
-                        styled_detail_mat = detail_material.style.map(
-                            highlight_status,
-                            subset=['Status_Stock']
-                        ).format({
+                        show_table(detail_material, 'detail_sku', status_columns=['Status_Stock'], formats={
                             "Ordered Quantity": "{:,.0f}",
                             "Stock_Batch": "{:,.0f}",
                             "Balance_Per_Line": "{:,.0f}"
                         })
-                        
-                        st.dataframe(styled_detail_mat, use_container_width=True)
+
+            # =========================================
+            # TAB 4: PERUBAHAN SEJAK UPLOAD SEBELUMNYA
+            # =========================================
+            with tab4:
+                st.subheader("Perubahan Defisit sejak Upload Sebelumnya")
+                incremental = result['incremental']
+                st.caption(
+                    f"Analisis {incremental['mode']}: {incremental['changed']:,} dari {incremental['materials']:,} "
+                    f"material dianalisis ulang dalam {incremental['seconds']:.2f} detik"
+                )
+
+                previous_result = None
+                if previous_analysis is not None:
+                    previous_result = previous_analysis['result']['locations'].get(selected_location)
+
+                if previous_analysis is None:
+                    st.info("Upload file berikutnya (mis. export terbaru) untuk melihat defisit baru dan yang sudah selesai.")
+                elif previous_result is None:
+                    st.info(f"Lokasi {selected_location} tidak ada di upload sebelumnya.")
+                else:
+                    with stage(app_stages, 'tab4_diff', rows_in=len(result['deficit'])) as record:
+                        diff_df = diff_deficits(previous_result['deficit'], result['deficit'])
+                        record['rows_out'] = len(diff_df)
+
+                    col1, col2, col3 = st.columns(3)
+                    col1.metric("Defisit Baru", f"{(diff_df['Perubahan'] == DEFISIT_BARU).sum():,}")
+                    col2.metric("Defisit Berubah", f"{(diff_df['Perubahan'] == DEFISIT_BERUBAH).sum():,}")
+                    col3.metric("Defisit Selesai", f"{(diff_df['Perubahan'] == DEFISIT_SELESAI).sum():,}")
+
+                    if diff_df.empty:
+                        st.success("Tidak ada perubahan batch defisit.")
+                    else:
+                        show_table(diff_df, 'perubahan', status_columns=['Perubahan'], formats={
+                            "Balance_Sebelum": "{:,.0f}",
+                            "Balance_Sekarang": "{:,.0f}"
+                        }, hide_index=True)
+
+            # =========================================
+            # TAB 5: SURPLUS ANTAR LOKASI
+            # =========================================
+            with tab5:
+                st.subheader("Surplus Batch di Lokasi Lain untuk Menutup Defisit")
+                cross_df = analysis['cross']
+
+                if len(location_options) < 2:
+                    st.info("Workbook hanya berisi satu lokasi stock. Tambahkan sheet `Loct_*` lain "
+                            "(atau kolom lokasi) untuk membandingkan antar lokasi.")
+                elif cross_df.empty:
+                    st.success("Tidak ada defisit yang bisa ditutup dari surplus lokasi lain.")
+                else:
+                    st.caption(
+                        "Setiap batch defisit dipasangkan dengan batch material yang sama di lokasi lain yang masih "
+                        "surplus setelah dipakai SO lokasinya sendiri. Batch yang sama ditampilkan lebih dulu."
+                    )
+                    with stage(app_stages, 'tab5_cross', rows_in=len(cross_df)):
+                        show_table(cross_df, 'antar_lokasi', status_columns=['Status'], formats={
+                            "Kekurangan": "{:,.0f}",
+                            "Surplus_Sumber": "{:,.0f}",
+                            "Qty_Bisa_Dipindah": "{:,.0f}"
+                        }, hide_index=True)
+
+                    lazy_download_button(
+                        label="📥 Download Surplus Antar Lokasi",
+                        key=analysis_key[:-1] + ('antar_lokasi',),
+                        sheet_names=[SHEET_ANTAR_LOKASI],
+                        build_tables=lambda: {SHEET_ANTAR_LOKASI: cross_df},
+                        base_name='Surplus_Antar_Lokasi',
+                        fmt=export_format
+                    )
+
+            # =========================================
+            # TAB 6: SKENARIO PEMINDAHAN BATCH (WHAT-IF)
+            # =========================================
+            with tab6:
+                st.subheader("Skenario Pemindahan Batch (What-If)")
+                st.caption(
+                    "Pindahkan SO line ke batch lain atau terapkan saran batch tanpa mengedit file. Saldo dihitung "
+                    "seperti tab 1 (Stock - Qty SO per batch); alokasi per line dihitung ulang saat file di-upload."
+                )
+                with stage(app_stages, 'tab6_scenario', rows_in=len(df_so_detail)):
+                    show_scenario(result, analysis_key, export_format)
+
+            log_stages(app_stages, scope='app', session=session_id, file=file_hash[:12])
+            if debug_mode:
+                show_debug_panel(analysis['stages'], app_stages)
 
         except Exception as e:
             st.error(f"Terjadi kesalahan: {e}")
@@ -543,3 +756,5 @@ if uploaded_file:
 
 else:
     st.info("Silakan upload file Excel di sidebar.")
+
+retain(session_id, held_keys)
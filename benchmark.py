@@ -0,0 +1,163 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from allocation import allocate_stock
+from analysis import (build_deficit, build_detail, build_report_tables, build_substitution, deficit_batches,
+                      deficit_shipments, is_tanpa_batch, preprocess, run_analysis, suggest_batches)
+from cube import build_stock_cube
+from export import write_xlsx_streaming
+from ingest import read_workbook
+from status import classify_balance
+from synthetic import generate_frames, write_workbook
+
+# Benchmark per tahap pipeline di atas workbook sintetis. Setiap tahap diukur
+# terpisah dan hasilnya ditambahkan ke file JSON Lines (satu baris per tahap
+# per ukuran), sehingga bisa dibandingkan antar commit.
+#
+#   python benchmark.py --lines 10000 100000 1000000 5000000 --output bench_results.jsonl
+
+DEFAULT_LINES = [10_000, 100_000, 1_000_000, 5_000_000]
+
+# Batas baris satu sheet Excel; tahap load/export xlsx dilewati di atas ini
+XLSX_MAX_LINES = 1_000_000
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(fn, repeat, trace_memory):
+    # Waktu terbaik dari beberapa ulangan; peak memori dari ulangan pertama
+    best = None
+    peak_mb = None
+    value = None
+    for i in range(repeat):
+        tracing = trace_memory and i == 0
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+        if tracing:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+        best = seconds if best is None else min(best, seconds)
+    return value, best, peak_mb
+
+
+def run_stages(lines, config, repeat=1, trace_memory=False, workdir=None):
+    # Hasil: list dict per tahap {'stage', 'seconds', 'rows', 'peak_mb'}
+    df_so, df_loct = generate_frames(so_lines=lines, **config)
+    records = []
+
+    def stage(name, fn, rows):
+        value, seconds, peak_mb = _measure(fn, repeat, trace_memory)
+        records.append({'stage': name, 'seconds': seconds, 'rows': rows, 'peak_mb': peak_mb})
+        return value
+
+    def skipped(name, reason):
+        records.append({'stage': name, 'seconds': None, 'rows': None, 'peak_mb': None, 'skipped': reason})
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        if lines <= XLSX_MAX_LINES:
+            path = os.path.join(tmp, 'input.xlsx')
+            write_workbook(path, df_so, df_loct)
+            stage('xlsx_load', lambda: read_workbook(path), lines)
+        else:
+            skipped('xlsx_load', f"> {XLSX_MAX_LINES:,} baris (batas sheet Excel)")
+
+        so, loct = stage('numeric_cleaning', lambda: preprocess(df_so.copy(), df_loct.copy()), lines)
+        cube, material = stage('cube_aggregation', lambda: build_stock_cube(so, loct), len(loct))
+        detail = stage('detail_merge', lambda: build_detail(so, cube, material), lines)
+        stage('status_classification', lambda: classify_balance(
+            detail['Balance_Per_Line'], tanpa_batch=is_tanpa_batch(detail['Batch Number'])
+        ), lines)
+        _, pairs = stage('allocation', lambda: allocate_stock(so, cube), lines)
+
+        so_with_batch = so[so['Batch Number'].notna()]
+        deficit = stage('deficit_aggregation', lambda: build_deficit(
+            cube, deficit_shipments(so_with_batch, deficit_batches(cube).index)
+        ), len(cube))
+        stage('substitution', lambda: build_substitution(cube, deficit), len(cube))
+
+        tanpa_batch = detail[is_tanpa_batch(detail['Batch Number'])]
+        stage('batch_suggestions', lambda: suggest_batches(tanpa_batch, cube, pairs), len(tanpa_batch))
+
+        result = stage('run_analysis_total', lambda: run_analysis(df_so.copy(), df_loct.copy()), lines)
+        if lines <= XLSX_MAX_LINES:
+            tables = build_report_tables(result)
+            out = os.path.join(tmp, 'report.xlsx')
+            stage('excel_export', lambda: write_xlsx_streaming(out, tables), sum(len(df) for df in tables.values()))
+        else:
+            skipped('excel_export', f"> {XLSX_MAX_LINES:,} baris (batas sheet Excel)")
+
+    return records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per tahap analisis defisit SO di data sintetis.")
+    parser.add_argument('--lines', type=int, nargs='+', default=DEFAULT_LINES, help="Ukuran SO line yang diuji")
+    parser.add_argument('--skus', type=int, default=None, help="Jumlah SKU (default: lines / 30)")
+    parser.add_argument('--batches', type=int, default=5)
+    parser.add_argument('--no-batch', type=float, default=0.3)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--text-numbers', type=float, default=0.05,
+                        help="Porsi angka teks, supaya tahap numeric_cleaning benar-benar memparsing")
+    parser.add_argument('--repeat', type=int, default=1, help="Ulangan per tahap (diambil yang tercepat)")
+    parser.add_argument('--memory', action='store_true', help="Ukur peak memori per tahap (tracemalloc, lebih lambat)")
+    parser.add_argument('--output', '-o', default='bench_results.jsonl', help="File JSON Lines hasil (append)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    run_info = {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+    }
+
+    with open(args.output, 'a', encoding='utf-8') as f:
+        for lines in args.lines:
+            config = {
+                'skus': args.skus or max(lines // 30, 1),
+                'batches_per_sku': args.batches,
+                'no_batch_share': args.no_batch,
+                'skew': args.skew,
+                'text_number_share': args.text_numbers,
+                'seed': args.seed,
+            }
+            print(f"== {lines:,} SO line, {config['skus']:,} SKU ==")
+            for record in run_stages(lines, config, args.repeat, args.memory):
+                record.update(run_info, lines=lines, **config)
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+
+                if record['seconds'] is None:
+                    print(f"  {record['stage']:<24} dilewati: {record['skipped']}")
+                else:
+                    peak = f"  peak {record['peak_mb']:,.1f} MB" if record['peak_mb'] is not None else ""
+                    print(f"  {record['stage']:<24} {record['seconds']:>9.3f} s{peak}")
+
+    print(f"Hasil: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
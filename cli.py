@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from export import (SHEET_ANTAR_LOKASI, SHEET_DEFISIT, SHEET_DETAIL, SHEET_SARAN, SHEET_SUBSTITUSI,
+                    write_full_report)
+from locations import build_location_report_tables, run_locations
+from numeric import NUMBER_FORMATS
+from snapshot_cache import CACHE_DIR, read_workbook_cached
+from status import DEFISIT, TANPA_BATCH
+from streaming import CHUNK_ROWS, run_streaming
+
+# Mode batch tanpa Streamlit: jalankan analisis tab 1 + tab 2 untuk banyak
+# workbook sekaligus (mis. satu file per cabang/gudang) di process pool.
+#
+#   python cli.py folder_input --output folder_report --format xlsx --workers 8
+#   python cli.py folder_besar --streaming --chunk-rows 200000 --workers 2
+
+PRIORITY_OPTIONS = {
+    'shipment': ('Shipment Number',),
+    'file': (),
+}
+
+SHEET_NAMES = {
+    'defisit': SHEET_DEFISIT,
+    'substitusi': SHEET_SUBSTITUSI,
+    'detail': SHEET_DETAIL,
+    'saran': SHEET_SARAN,
+    'antar_lokasi': SHEET_ANTAR_LOKASI,
+}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_report(tables, output_dir, name, fmt):
+    if fmt == 'xlsx':
+        path = os.path.join(output_dir, f"{name}_report.xlsx")
+        write_full_report(path, {SHEET_NAMES[key]: df for key, df in tables.items()})
+        return [path]
+
+    report_dir = os.path.join(output_dir, name)
+    os.makedirs(report_dir, exist_ok=True)
+    paths = []
+    for key, df in tables.items():
+        path = os.path.join(report_dir, f"{key}.parquet")
+        df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _process_in_memory(path, output_dir, name, fmt, line_priority, batch_order, cache_dir, number_format):
+    file_hash = file_sha256(path)
+    df_so, df_loct, error_msg, load_stats = read_workbook_cached(path, file_hash, cache_dir, number_format=number_format)
+    if error_msg:
+        raise ValueError(error_msg)
+
+    # Satu worker per file; lokasi dalam file dianalisis berurutan di worker ini
+    analysis = run_locations(df_so, df_loct, None, line_priority, batch_order, workers=1)
+    tables = build_location_report_tables(analysis)
+    write_report(tables, output_dir, name, fmt)
+
+    return {
+        **analysis_summary(df_so, df_loct, analysis, tables['defisit']),
+        'angka_invalid': sum(report['coerced'] for stat in load_stats.values() for report in stat['parse']),
+    }
+
+
+def analysis_summary(df_so, df_loct, analysis, deficit_df):
+    # so_lines = baris SO_B2B. SO tanpa lokasi dianalisis di setiap lokasi, jadi
+    # jumlah line defisit/tanpa batch adalah total (lokasi, line), bukan line unik.
+    results = analysis['locations'].values()
+    return {
+        'lokasi': len(analysis['locations']),
+        'so_lines': len(df_so),
+        'stock_rows': len(df_loct),
+        'line_defisit_per_lokasi': sum(int((result['detail']['Status_Stock'] == DEFISIT).sum()) for result in results),
+        'line_tanpa_batch_per_lokasi': sum(
+            int((result['detail']['Status_Stock'] == TANPA_BATCH).sum()) for result in results
+        ),
+        **deficit_summary(deficit_df),
+    }
+
+
+def deficit_summary(deficit_df):
+    return {
+        'batch_defisit': len(deficit_df),
+        'qty_defisit': -deficit_df['Balance'].sum(),
+        'material_defisit': deficit_df['Material'].nunique(),
+    }
+
+
+def _process_streaming(path, output_dir, name, fmt, number_format, chunk_rows):
+    # SO_B2B dibaca per chunk; detail per line langsung ke Parquet (bisa melebihi batas baris Excel)
+    result = run_streaming(path, os.path.join(output_dir, f"{name}_detail.parquet"), chunk_rows, number_format)
+    write_report({'defisit': result['deficit'], 'substitusi': result['substitusi']}, output_dir, name, fmt)
+
+    stats = result['stats']
+    return {
+        'so_lines': stats['so_lines'],
+        'stock_rows': stats['stock_rows'],
+        # Mode streaming selalu satu lokasi; nama kolom sama dengan mode in-memory
+        'line_defisit_per_lokasi': stats['line_defisit'],
+        'line_tanpa_batch_per_lokasi': stats['line_tanpa_batch'],
+        'angka_invalid': sum(report['coerced'] for report in stats['parse']),
+        **deficit_summary(result['deficit']),
+    }
+
+
+def process_workbook(path, output_dir, fmt, line_priority, batch_order, cache_dir, number_format='auto',
+                     chunk_rows=None):
+    # Dijalankan di worker process; error dikembalikan sebagai record, tidak dilempar.
+    # chunk_rows diisi -> mode streaming (tanpa alokasi, tanpa snapshot cache)
+    name = os.path.splitext(os.path.basename(path))[0]
+    record = {'file': os.path.basename(path), 'status': 'OK', 'error': None}
+    start = time.perf_counter()
+    try:
+        if chunk_rows:
+            record.update(_process_streaming(path, output_dir, name, fmt, number_format, chunk_rows))
+        else:
+            record.update(_process_in_memory(path, output_dir, name, fmt, line_priority, batch_order, cache_dir,
+                                             number_format))
+    except Exception as e:
+        record['status'] = 'GAGAL'
+        record['error'] = f"{type(e).__name__}: {e}"
+
+    record['seconds'] = time.perf_counter() - start
+    record['lines_per_second'] = record.get('so_lines', 0) / record['seconds'] if record['seconds'] else 0
+    return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analisis defisit stock SO untuk banyak workbook sekaligus.")
+    parser.add_argument('input_dir', help="Folder berisi file .xlsx (sheet SO_B2B dan satu/lebih sheet Loct_*)")
+    parser.add_argument('--output', '-o', default='reports', help="Folder output report (default: reports)")
+    parser.add_argument('--format', '-f', choices=['xlsx', 'parquet'], default='xlsx')
+    parser.add_argument('--workers', '-w', type=int, default=os.cpu_count(), help="Jumlah worker process")
+    parser.add_argument('--priority', choices=list(PRIORITY_OPTIONS), default='shipment',
+                        help="Urutan alokasi SO line: shipment number atau urutan baris file")
+    parser.add_argument('--batch-order', default='Batch',
+                        help="Kolom urutan batch di sheet Loct_* ('Batch' = FIFO, kolom expiry = FEFO)")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Folder snapshot cache")
+    parser.add_argument('--number-format', choices=list(NUMBER_FORMATS), default='auto',
+                        help="Pemisah ribuan/desimal angka teks: auto, en (1,234.5) atau id (1.234,5)")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Baca SO_B2B per chunk untuk file yang tidak muat di RAM "
+                             "(defisit + substitusi, detail per line ke Parquet, tanpa kolom alokasi)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Jumlah SO line per chunk di mode streaming")
+    args = parser.parse_args(argv)
+
+    paths = sorted(
+        os.path.join(args.input_dir, name)
+        for name in os.listdir(args.input_dir)
+        if name.lower().endswith('.xlsx') and not name.startswith('~$')
+    )
+    if not paths:
+        print(f"Tidak ada file .xlsx di {args.input_dir}", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.output, exist_ok=True)
+    line_priority = PRIORITY_OPTIONS[args.priority]
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(process_workbook, path, args.output, args.format, line_priority, args.batch_order, args.cache_dir,
+                        args.number_format, args.chunk_rows if args.streaming else None): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                # Worker mati (mis. kehabisan memori) - catat dan lanjutkan file lain
+                record = {'file': os.path.basename(futures[future]), 'status': 'GAGAL', 'error': f"{type(e).__name__}: {e}"}
+            records.append(record)
+            print(f"[{record['status']}] {record['file']} ({record.get('seconds', 0):.1f} detik)"
+                  + (f" - {record['error']}" if record['error'] else ""))
+    wall = time.perf_counter() - start
+
+    summary = pd.DataFrame(records).sort_values('file')
+    summary.to_csv(os.path.join(args.output, 'ringkasan.csv'), index=False)
+
+    ok = summary[summary['status'] == 'OK']
+    failed = summary[summary['status'] != 'OK']
+    total_lines = ok['so_lines'].sum() if 'so_lines' in ok else 0
+    print()
+    print(f"Selesai: {len(ok)} OK, {len(failed)} gagal dari {len(summary)} file dalam {wall:.1f} detik")
+    print(f"Throughput: {len(summary) / wall:.2f} file/detik, {total_lines / wall:,.0f} SO line/detik")
+    if not ok.empty:
+        print(f"Batch defisit: {int(ok['batch_defisit'].sum()):,}, qty defisit: {ok['qty_defisit'].sum():,.0f}")
+    print(f"Ringkasan: {os.path.join(args.output, 'ringkasan.csv')}")
+
+    return 1 if len(failed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# Representasi hemat memori (opsional) untuk frame SO/stock hasil analisis:
+# kolom teks berulang (Material, Batch, Shipment Number) menjadi categorical,
+# angka di-downcast tanpa kehilangan nilai, status sudah categorical dari
+# status.py.
+#
+# Target awal 3-5x lebih kecil TIDAK selalu tercapai. Hasil ukur 200k SO line:
+# frame dari workbook (teks object) ~5.6x, frame yang teksnya sudah string
+# pandas ~2.6x, qty desimal (mis. 12.345) ~1.8x. Qty desimal tetap float64
+# karena float32 tidak menyimpannya persis, dan selisih kecil akan mengubah
+# status PAS/DEFISIT di perhitungan berikutnya (mis. skenario).
+
+# Kolom teks dijadikan categorical bila jumlah nilai unik < rasio ini
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def downcast_numeric(s):
+    # Minimal int32/float32 supaya operasi aritmatika berikutnya tidak overflow
+    if pd.api.types.is_bool_dtype(s):
+        return s
+    values = s.to_numpy(dtype='float64', na_value=np.nan)
+    finite = values[~np.isnan(values)]
+
+    if not np.isnan(values).any() and np.array_equal(finite, np.round(finite)) and (
+        finite.size == 0 or (finite.min() >= np.iinfo(np.int32).min and finite.max() <= np.iinfo(np.int32).max)
+    ):
+        return pd.Series(values.astype(np.int32), index=s.index, name=s.name)
+
+    as_float32 = values.astype(np.float32)
+    if np.array_equal(as_float32.astype(np.float64), values, equal_nan=True):
+        return pd.Series(as_float32, index=s.index, name=s.name)
+    return s
+
+
+def compact_frame(df):
+    columns = {}
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or pd.api.types.is_datetime64_any_dtype(s):
+            columns[col] = s
+        elif pd.api.types.is_numeric_dtype(s):
+            columns[col] = downcast_numeric(s)
+        elif len(s) and s.nunique(dropna=True) / len(s) < CATEGORY_MAX_UNIQUE_RATIO:
+            columns[col] = s.astype('category')
+        else:
+            columns[col] = s
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frame_mb(df):
+    return df.memory_usage(index=True, deep=True).sum() / 1024 ** 2
+
+
+def memory_report(before, after):
+    # before/after: dict nama frame -> DataFrame
+    report = pd.DataFrame({
+        'Frame': list(before),
+        'Sebelum_MB': [frame_mb(df) for df in before.values()],
+        'Sesudah_MB': [frame_mb(after[name]) for name in before],
+    })
+    total = pd.DataFrame({
+        'Frame': ['TOTAL'],
+        'Sebelum_MB': [report['Sebelum_MB'].sum()],
+        'Sesudah_MB': [report['Sesudah_MB'].sum()],
+    })
+    report = pd.concat([report, total], ignore_index=True)
+    report['Rasio'] = report['Sebelum_MB'] / report['Sesudah_MB'].where(report['Sesudah_MB'] > 0)
+    return report
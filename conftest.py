@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modul aplikasi berada langsung di root repo (tanpa package); root dimasukkan
+# ke sys.path supaya test di tests/ bisa mengimpornya
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,79 @@
+import pandas as pd
+
+# Cube stock & demand per (Material, Batch), dibangun sekali per upload lalu
+# dipakai ulang oleh semua tab, alokasi, dan export (bukan groupby ulang
+# df_loct/df_so di setiap fungsi).
+#
+# cube (index Material, Batch; hanya batch terisi):
+#   Stock          total Unrestricted per batch (boleh negatif)
+#   Stock_Positif  total baris Unrestricted > 0 (NaN bila tidak ada), untuk saran batch
+#   Baris_Stock    jumlah baris Loct_F211 per batch (0 = batch hanya ada di SO)
+#   Qty_SO         total Ordered Quantity SO line yang sudah punya batch
+#   Baris_SO       jumlah SO line per batch (0 = batch tidak diminta SO)
+#   Sisa_Stock     Stock - Qty_SO
+#   kolom lain Loct_F211 (mis. tanggal expiry) -> nilai minimum per batch
+#
+# material (index Material): Total_Stock_Material (termasuk stock tanpa batch)
+# dan Qty_SO per material.
+
+CUBE_KEYS = ['Material', 'Batch']
+
+
+def aggregate_stock(df_loct):
+    # Hasil: stock per (Material, Batch) terisi dan total stock per material
+    stock_grouped = df_loct.groupby(CUBE_KEYS, observed=True, dropna=False)
+    stock = pd.DataFrame({
+        'Stock': stock_grouped['Unrestricted'].sum(),
+        'Stock_Positif': df_loct['Unrestricted'].where(df_loct['Unrestricted'] > 0)
+            .groupby([df_loct['Material'], df_loct['Batch']], observed=True, dropna=False).sum(min_count=1),
+        'Baris_Stock': stock_grouped.size(),
+    })
+    order_cols = [col for col in df_loct.columns if col not in CUBE_KEYS + ['Unrestricted']]
+    if order_cols:
+        stock = stock.join(stock_grouped[order_cols].min())
+
+    # Stock tanpa batch hanya dihitung di total per material
+    stock_material = stock.groupby(level='Material', observed=True)['Stock'].sum()
+    stock = stock[stock.index.get_level_values('Batch').notna()]
+    return stock, stock_material
+
+
+def aggregate_demand(df_so):
+    # Demand SO line yang punya batch; bisa dihitung per chunk lalu digabung dengan merge_demand
+    so_grouped = df_so.groupby(['Material', 'Batch Number'], observed=True)['Ordered Quantity']
+    demand = pd.DataFrame({
+        'Qty_SO': so_grouped.sum(),
+        'Baris_SO': so_grouped.size(),
+    })
+    demand.index.names = CUBE_KEYS
+    return demand
+
+
+def merge_demand(demand, other):
+    if demand is None:
+        return other
+    return pd.concat([demand, other]).groupby(level=CUBE_KEYS, observed=True).sum()
+
+
+def combine_cube(stock, stock_material, demand):
+    cube = stock.join(demand, how='outer').sort_index()
+    cube['Stock'] = cube['Stock'].fillna(0)
+    cube['Baris_Stock'] = cube['Baris_Stock'].fillna(0).astype('int64')
+    cube['Qty_SO'] = cube['Qty_SO'].fillna(0)
+    cube['Baris_SO'] = cube['Baris_SO'].fillna(0).astype('int64')
+    cube['Sisa_Stock'] = cube['Stock'] - cube['Qty_SO']
+
+    material = pd.DataFrame({
+        'Total_Stock_Material': stock_material,
+        'Qty_SO': cube.groupby(level='Material', observed=True)['Qty_SO'].sum(),
+    })
+    material['Total_Stock_Material'] = material['Total_Stock_Material'].fillna(0)
+    material['Qty_SO'] = material['Qty_SO'].fillna(0)
+    material.index.name = 'Material'
+
+    return cube, material
+
+
+def build_stock_cube(df_so, df_loct):
+    stock, stock_material = aggregate_stock(df_loct)
+    return combine_cube(stock, stock_material, aggregate_demand(df_so))
@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+import uuid
+import zipfile
+
+from openpyxl import Workbook
+
+from snapshot_cache import SNAPSHOT_VERSION, evict
+
+# --- FUNGSI EXPORT ---
+# Dipakai oleh dashboard (download button) dan oleh mode batch CLI.
+# Excel ditulis dengan openpyxl mode write-only (streaming, memori konstan);
+# CSV dan Parquet tersedia sebagai alternatif yang jauh lebih cepat.
+
+SHEET_DEFISIT = 'Data Defisit (Action Needed)'
+SHEET_SUBSTITUSI = 'Opsi Substitusi (Stock Tersedia)'
+SHEET_DETAIL = 'Detail SKU per SO'
+SHEET_SARAN = 'Saran Batch untuk SO Tanpa Batch'
+SHEET_ANTAR_LOKASI = 'Antar Lokasi (Surplus-Defisit)'
+SHEET_SKENARIO = 'Skenario Pemindahan Batch'
+SHEET_SKENARIO_SALDO = 'Saldo Batch Skenario'
+
+EXPORT_FORMATS = ['xlsx', 'csv', 'parquet']
+MIME_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'zip': 'application/zip',
+}
+
+EXPORT_DIR = os.environ.get('SO_EXPORT_DIR', os.path.join('.cache', 'exports'))
+EXPORT_MAX_BYTES = int(os.environ.get('SO_EXPORT_MAX_MB', '1024')) * 1024 ** 2
+# Naikkan bila kolom/logika tabel export berubah (file export lama tidak dipakai lagi)
+EXPORT_VERSION = 2
+
+# Jumlah baris yang dikonversi ke objek Python sekaligus saat menulis Excel
+CHUNK_ROWS = 10_000
+
+
+def write_xlsx_streaming(target, tables, chunk_rows=CHUNK_ROWS):
+    wb = Workbook(write_only=True)
+    for sheet_name, df in tables.items():
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append([str(col) for col in df.columns])
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows].astype(object)
+            for row in chunk.where(chunk.notna(), None).itertuples(index=False, name=None):
+                ws.append(row)
+    wb.save(target)
+
+
+def export_extension(tables, fmt):
+    # Beberapa tabel dalam CSV/Parquet dibungkus menjadi satu zip
+    if fmt != 'xlsx' and len(tables) > 1:
+        return 'zip'
+    return fmt
+
+
+def _table_file_name(sheet_name, fmt):
+    return f"{sheet_name}.{fmt}"
+
+
+def write_export(target, tables, fmt):
+    if fmt == 'xlsx':
+        write_xlsx_streaming(target, tables)
+        return
+
+    if len(tables) == 1:
+        df = next(iter(tables.values()))
+        if fmt == 'csv':
+            df.to_csv(target, index=False)
+        else:
+            df.to_parquet(target, index=False)
+        return
+
+    with zipfile.ZipFile(target, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for sheet_name, df in tables.items():
+            with zf.open(_table_file_name(sheet_name, fmt), 'w') as f:
+                if fmt == 'csv':
+                    with io.TextIOWrapper(f, encoding='utf-8', newline='') as text:
+                        df.to_csv(text, index=False)
+                else:
+                    df.to_parquet(f, index=False)
+
+
+def cached_export(key, build_tables, fmt, export_dir=EXPORT_DIR, max_bytes=EXPORT_MAX_BYTES):
+    # File export dibuat hanya saat diminta, lalu disimpan di disk per
+    # (hasil analisis, filter, format) sehingga klik berikutnya langsung terpakai.
+    # build_tables dipanggil hanya bila file belum ada di cache.
+    # Versi snapshot ikut di key: frame hasil parsing yang berubah juga mengubah isi export
+    digest = hashlib.sha256(repr((key, fmt, EXPORT_VERSION, SNAPSHOT_VERSION)).encode('utf-8')).hexdigest()
+    existing = [name for name in os.listdir(export_dir) if name.startswith(digest + '.')] if os.path.isdir(export_dir) else []
+    existing = [name for name in existing if '.tmp-' not in name]
+    if existing:
+        path = os.path.join(export_dir, existing[0])
+        os.utime(path)
+        return path
+
+    tables = build_tables()
+    path = os.path.join(export_dir, f"{digest}.{export_extension(tables, fmt)}")
+    os.makedirs(export_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        write_export(tmp_path, tables, fmt)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    evict(export_dir, max_bytes, keep=os.path.basename(path))
+    return path
+
+
+def write_full_report(path, tables):
+    # Satu workbook berisi semua tabel hasil analisis (nama sheet -> DataFrame)
+    write_xlsx_streaming(path, tables)
@@ -0,0 +1,181 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from analysis import attach_sku_index, preprocess, run_analysis
+from instrument import stage
+from status import classify_perubahan
+
+# Analisis ulang inkremental antar upload: baris SO_B2B dan Loct_F211 di-hash
+# per Material, lalu hanya material yang berubah yang dianalisis ulang dan
+# disambung ke hasil upload sebelumnya. Semua tahap analysis.py independen
+# per material (stock, alokasi, defisit, substitusi, saran), jadi hasilnya
+# sama dengan analisis penuh.
+
+# Pengali untuk mencampur posisi baris dalam satu material ke hash baris,
+# supaya urutan line (dipakai alokasi) ikut terdeteksi
+_POSITION_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hash_per_material(df):
+    # Jumlah (uint64, wrap) hash baris yang sudah dicampur posisinya dalam material
+    if df.empty:
+        return pd.Series(dtype='uint64')
+    rows = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    position = df.groupby('Material', sort=False).cumcount().to_numpy().astype(np.uint64)
+    with np.errstate(over='ignore'):
+        mixed = rows ^ ((position + np.uint64(1)) * _POSITION_MIX)
+    return pd.Series(mixed, index=df.index).groupby(df['Material'].to_numpy()).sum()
+
+
+def material_hashes(df_so, df_loct):
+    # 0 = material tidak punya baris di sheet itu (tetap uint64, tanpa NaN/float)
+    so_hash = _hash_per_material(df_so)
+    loct_hash = _hash_per_material(df_loct)
+    index = so_hash.index.union(loct_hash.index)
+    return pd.DataFrame({
+        'SO': so_hash.reindex(index, fill_value=0),
+        'Loct': loct_hash.reindex(index, fill_value=0),
+    })
+
+
+def changed_materials(hashes, previous_hashes):
+    # Material baru, hilang, atau barisnya berubah di salah satu sheet
+    index = hashes.index.union(previous_hashes.index)
+    before = previous_hashes.reindex(index, fill_value=0)
+    after = hashes.reindex(index, fill_value=0)
+    return set(index[(before != after).any(axis=1)])
+
+
+def _position_map(previous_materials, materials, previous_kept, kept):
+    # Baris material yang tidak berubah: posisi lama -> posisi baru. Isi tiap
+    # material identik, jadi urutan dalam material sama di kedua upload.
+    old_pos = np.flatnonzero(previous_kept)
+    new_pos = np.flatnonzero(kept)
+    old_materials = previous_materials[old_pos]
+    new_materials = materials[new_pos]
+    if not np.array_equal(old_materials, new_materials):
+        # Urutan antar material bergeser: sejajarkan per material (stable sort)
+        old_pos = old_pos[np.argsort(old_materials, kind='stable')]
+        new_pos = new_pos[np.argsort(new_materials, kind='stable')]
+
+    mapping = np.full(len(previous_materials), -1, dtype=np.int64)
+    mapping[old_pos] = new_pos
+    return mapping
+
+
+def _splice_lines(previous, partial, df_so, changed):
+    materials = df_so['Material'].to_numpy(dtype=object)
+    kept = ~df_so['Material'].isin(changed).to_numpy()
+    previous_materials = previous['so']['Material'].to_numpy(dtype=object)
+    previous_kept = ~previous['so']['Material'].isin(changed).to_numpy()
+    mapping = _position_map(previous_materials, materials, previous_kept, kept)
+    changed_pos = np.flatnonzero(~kept)
+
+    # Detail sejajar dengan posisi baris df_so baru
+    positions = np.concatenate([mapping[previous_kept], changed_pos])
+    detail = pd.concat([previous['detail'][previous_kept], partial['detail']], ignore_index=True)
+    detail = detail.iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
+
+    # Line_Index alokasi line tanpa batch mengikuti posisi baru
+    previous_pairs = previous['alokasi_tanpa_batch']
+    previous_lines = mapping[previous_pairs['Line_Index'].to_numpy()]
+    pairs = pd.concat([
+        previous_pairs[previous_lines >= 0].assign(Line_Index=previous_lines[previous_lines >= 0]),
+        partial['alokasi_tanpa_batch'].assign(
+            Line_Index=changed_pos[partial['alokasi_tanpa_batch']['Line_Index'].to_numpy()]
+        ),
+    ], ignore_index=True)
+    pairs = pairs.sort_values('Line_Index', kind='stable').reset_index(drop=True)
+    return detail, pairs
+
+
+def _splice_materials(previous_df, partial_df, changed, sort_by):
+    kept = previous_df[~previous_df['Material'].isin(changed)]
+    spliced = pd.concat([kept, partial_df], ignore_index=True)
+    return spliced.sort_values(sort_by, kind='stable').reset_index(drop=True)
+
+
+def _splice_indexed(previous_df, partial_df, changed):
+    materials = previous_df.index.get_level_values('Material')
+    return pd.concat([previous_df[~materials.isin(changed)], partial_df]).sort_index()
+
+
+def run_incremental(df_so, df_loct, previous=None, line_priority=('Shipment Number',), batch_order='Batch',
+                    compact=False, analyze=run_analysis):
+    # Seperti run_analysis, ditambah 'hashes', 'params', dan 'incremental'
+    # (ringkasan material yang dianalisis ulang). previous = hasil run_incremental
+    # upload sebelumnya; analisis penuh bila tidak ada, parameter berbeda, atau mode compact.
+    # analyze: fungsi dengan signature run_analysis (mis. versi paralel di locations.py);
+    # frame di-preprocess sekali di sini untuk hash, lalu diteruskan dengan preprocessed=True
+    start = time.perf_counter()
+    stages = []
+    with stage(stages, 'material_hash', rows_in=len(df_so) + len(df_loct)) as record:
+        df_so, df_loct = preprocess(df_so, df_loct)
+        hashes = material_hashes(df_so, df_loct)
+        record['rows_out'] = len(hashes)
+    params = (tuple(line_priority), batch_order, compact)
+
+    reusable = previous is not None and previous.get('params') == params and not compact
+    if not reusable:
+        result = analyze(df_so, df_loct, line_priority, batch_order, compact, preprocessed=True)
+        changed = set(hashes.index)
+    else:
+        changed = changed_materials(hashes, previous['hashes'])
+        partial = analyze(
+            df_so[df_so['Material'].isin(changed)].reset_index(drop=True),
+            df_loct[df_loct['Material'].isin(changed)].reset_index(drop=True),
+            line_priority, batch_order, preprocessed=True
+        )
+        stages.extend(partial['stages'])
+
+        with stage(stages, 'splice', rows_in=len(previous['detail']) + len(partial['detail'])) as record:
+            detail, pairs = _splice_lines(previous, partial, df_so, changed)
+            record['rows_out'] = len(detail)
+
+        result = {
+            'has_batch': bool(df_so['Batch Number'].notna().any()),
+            'memory': None,
+            'so': df_so,
+            'loct': df_loct,
+            'cube': _splice_indexed(previous['cube'], partial['cube'], changed),
+            'material': _splice_indexed(previous['material'], partial['material'], changed),
+            'detail': detail,
+            'alokasi_tanpa_batch': pairs,
+            'deficit': _splice_materials(previous['deficit'], partial['deficit'], changed, ['Material', 'Batch']),
+            'substitusi': _splice_materials(
+                previous['substitusi'], partial['substitusi'], changed,
+                ['Material', 'Status', 'Sisa_Stock_Bisa_Pakai']
+            ),
+        }
+        with stage(stages, 'sku_index', rows_in=len(detail)):
+            attach_sku_index(result)
+
+    if not reusable:
+        stages.extend(result['stages'])
+    result['stages'] = stages
+    result['hashes'] = hashes
+    result['params'] = params
+    result['incremental'] = {
+        'mode': 'inkremental' if reusable else 'penuh',
+        'changed': len(changed),
+        'materials': len(hashes),
+        'seconds': time.perf_counter() - start,
+    }
+    return result
+
+
+def diff_deficits(previous_deficit, deficit):
+    # Batch defisit baru, yang balance-nya berubah, dan yang sudah tidak defisit
+    keys = ['Material', 'Batch']
+    merged = previous_deficit[keys + ['Balance']].merge(
+        deficit[keys + ['Balance']], on=keys, how='outer', suffixes=('_Sebelum', '_Sekarang'), indicator=True
+    )
+    before = merged['_merge'] != 'right_only'
+    after = merged['_merge'] != 'left_only'
+    changed = ~(before & after) | (merged['Balance_Sebelum'] != merged['Balance_Sekarang'])
+
+    diff = merged[changed].drop(columns='_merge').reset_index(drop=True)
+    diff['Perubahan'] = classify_perubahan(before[changed], after[changed]).to_numpy()
+    return diff.sort_values(['Perubahan', 'Material', 'Batch'], kind='stable').reset_index(drop=True)
@@ -0,0 +1,241 @@
+import pandas as pd
+from openpyxl import load_workbook
+
+from instrument import stage
+from numeric import format_name, parse_number_column
+
+# Loader workbook satu kali baca: openpyxl mode read-only (streaming), hanya
+# kolom yang dipakai analisis yang diambil, dengan dtype eksplisit.
+#
+# Stock boleh tersebar di beberapa sheet Loct_* (satu per plant/storage
+# location) dan/atau punya kolom lokasi sendiri; semua digabung menjadi satu
+# frame stock dengan kolom 'Lokasi'.
+
+SO_SHEET = 'SO_B2B'
+# Sheet stock: Loct_F211, Loct_F212, ... (lokasi = nama sheet tanpa prefix)
+LOCT_PREFIX = 'Loct_'
+
+# Kolom lokasi di frame hasil load, dan nama kolom sumber yang dikenali per
+# jenis sheet. SO_B2B boleh memakai kolom Plant untuk membagi SO line per lokasi
+# (hanya nilai yang sama dengan lokasi stock yang dipakai, lihat
+# locations.split_locations). Di sheet Loct_* lokasi = nama sheet atau kolom
+# storage location eksplisit, tidak pernah Plant: beberapa sheet Loct_* biasanya
+# berbagi satu Plant dan stock-nya akan tergabung menjadi satu lokasi.
+LOCATION_COLUMN = 'Lokasi'
+LOCATION_HEADERS = {
+    SO_SHEET: ('lokasi', 'location', 'plant', 'storage location', 'sloc'),
+    LOCT_PREFIX: ('lokasi', 'storage location', 'sloc'),
+}
+
+# Kolom yang dibaca per sheet -> jenis data
+SO_COLUMNS = {
+    'Material': 'text',
+    'Batch Number': 'text',
+    'Ordered Quantity': 'number',
+    'Shipment Number': 'text',
+}
+LOCT_COLUMNS = {
+    'Material': 'text',
+    'Batch': 'text',
+    'Unrestricted': 'number',
+}
+
+# Kolom wajib per jenis sheet (kolom batch SO dicek saat preprocessing)
+REQUIRED_COLUMNS = {
+    SO_SHEET: ['Material', 'Ordered Quantity', 'Shipment Number'],
+    LOCT_PREFIX: ['Material', 'Batch', 'Unrestricted'],
+}
+
+# Kolom tanggal expiry opsional di stock (untuk urutan FEFO)
+EXPIRY_KEYWORDS = ('exp', 'sled', 'bbd')
+
+
+def _to_text(values):
+    # Kode material/batch bisa tersimpan sebagai angka di Excel
+    return [
+        None if v is None
+        else str(int(v)) if isinstance(v, float) and v.is_integer()
+        else str(v)
+        for v in values
+    ]
+
+
+def _to_column(values, kind):
+    if kind == 'text':
+        return pd.Series(_to_text(values), dtype=object)
+    if kind == 'number':
+        # Kolom angka murni langsung float64; teks (mis. "1,234") diparsing per kolom
+        if all(v is None or isinstance(v, (int, float)) for v in values):
+            return pd.Series(values, dtype='float64')
+        return pd.Series(values, dtype=object)
+    return pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+
+
+def stock_sheets(sheet_names):
+    return [name for name in sheet_names if name.startswith(LOCT_PREFIX)]
+
+
+def location_name(sheet_name):
+    return sheet_name[len(LOCT_PREFIX):]
+
+
+def _sheet_kind(sheet_name):
+    return SO_SHEET if sheet_name == SO_SHEET else LOCT_PREFIX
+
+
+def _select_columns(header, sheet_name):
+    header = ['' if h is None else str(h) for h in header]
+    wanted = SO_COLUMNS if sheet_name == SO_SHEET else LOCT_COLUMNS
+    selected = {}
+    for name, kind in wanted.items():
+        if name in header:
+            selected[name] = (header.index(name), kind)
+
+    if sheet_name == SO_SHEET and 'Batch Number' not in selected:
+        # Nama kolom batch di SO_B2B tidak selalu 'Batch Number'
+        batch_col = [i for i, h in enumerate(header) if 'batch' in h.lower()]
+        if batch_col:
+            selected[header[batch_col[0]]] = (batch_col[0], 'text')
+
+    location_headers = LOCATION_HEADERS[_sheet_kind(sheet_name)]
+    location_col = [i for i, h in enumerate(header) if h.strip().lower() in location_headers]
+    if location_col:
+        selected[LOCATION_COLUMN] = (location_col[0], 'text')
+
+    if sheet_name.startswith(LOCT_PREFIX):
+        for i, h in enumerate(header):
+            if any(key in h.lower() for key in EXPIRY_KEYWORDS):
+                selected[h] = (i, 'date')
+
+    return selected
+
+
+def _build_frame(selected, data, excel_rows, number_formats, parse_reports):
+    df = pd.DataFrame({
+        name: _to_column(values, kind)
+        for (name, (_, kind)), values in zip(selected.items(), data)
+    })
+
+    for name, (_, kind) in selected.items():
+        if kind != 'number':
+            continue
+        df[name], report = parse_number_column(df[name], number_formats[name])
+        for sample in report['sample']:
+            sample['row'] = excel_rows[sample['row']]
+        parse_reports.append(report)
+        # Format hasil deteksi otomatis dikunci untuk chunk berikutnya (hanya bila ada bukti)
+        if report['thousands'] is not None:
+            number_formats[name] = format_name(report['thousands'], report['decimal'])
+
+    return df
+
+
+def iter_sheet_chunks(ws, sheet_name, number_format='auto', chunk_rows=None):
+    # Hasil per chunk: DataFrame dan laporan parsing kolom angka chunk itu.
+    # chunk_rows=None -> satu chunk berisi seluruh sheet.
+    ws.reset_dimensions()
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        yield pd.DataFrame(), []
+        return
+
+    selected = _select_columns(header, sheet_name)
+    positions = [pos for pos, _ in selected.values()]
+    number_formats = {name: number_format for name in selected}
+    data = [[] for _ in positions]
+    # Nomor baris Excel untuk setiap baris data (baris kosong dilewati)
+    excel_rows = []
+    yielded = False
+    for row_number, row in enumerate(rows, start=2):
+        values = [row[pos] if pos < len(row) else None for pos in positions]
+        if all(v is None for v in values):
+            continue
+        excel_rows.append(row_number)
+        for col, v in zip(data, values):
+            col.append(v)
+
+        if chunk_rows and len(excel_rows) >= chunk_rows:
+            parse_reports = []
+            yield _build_frame(selected, data, excel_rows, number_formats, parse_reports), parse_reports
+            yielded = True
+            data = [[] for _ in positions]
+            excel_rows = []
+
+    if excel_rows or not yielded:
+        parse_reports = []
+        yield _build_frame(selected, data, excel_rows, number_formats, parse_reports), parse_reports
+
+
+def _read_sheet(ws, sheet_name, number_format):
+    # Hasil: DataFrame dan laporan parsing kolom angka
+    return next(iter_sheet_chunks(ws, sheet_name, number_format))
+
+
+def open_workbook(file):
+    # Hasil: workbook read-only (None bila sheet wajib tidak ada) dan pesan error
+    wb = load_workbook(file, read_only=True, data_only=True)
+    missing_sheets = []
+    if SO_SHEET not in wb.sheetnames:
+        missing_sheets.append(SO_SHEET)
+    if not stock_sheets(wb.sheetnames):
+        missing_sheets.append(f"{LOCT_PREFIX}* (mis. Loct_F211)")
+    if missing_sheets:
+        wb.close()
+        return None, f"Sheet hilang: {', '.join(missing_sheets)}"
+    return wb, None
+
+
+def missing_columns_error(df, sheet_name):
+    missing_cols = [c for c in REQUIRED_COLUMNS[_sheet_kind(sheet_name)] if c not in df.columns]
+    if missing_cols:
+        return f"Kolom hilang di sheet {sheet_name}: {', '.join(missing_cols)}"
+    return None
+
+
+def with_location(df_loct, sheet_name):
+    # Lokasi dari kolom lokasi di sheet bila ada, selain itu dari nama sheet
+    location = location_name(sheet_name)
+    if LOCATION_COLUMN in df_loct.columns:
+        return df_loct.assign(**{LOCATION_COLUMN: df_loct[LOCATION_COLUMN].fillna(location)})
+    return df_loct.assign(**{LOCATION_COLUMN: location})
+
+
+def read_workbook(file, number_format='auto'):
+    # Hasil: df_so, df_loct (semua sheet Loct_* + kolom Lokasi), pesan error
+    # (None jika OK), statistik per sheet. Memori per sheet = perubahan RSS
+    # (instrument.stage); peak tracemalloc hanya bila pemanggil sudah
+    # mengaktifkannya (benchmark --memory)
+    wb, error_msg = open_workbook(file)
+    if error_msg:
+        return None, None, error_msg, {}
+
+    sheet_names = [SO_SHEET] + stock_sheets(wb.sheetnames)
+    try:
+        frames = {}
+        stats = {}
+        records = []
+        for sheet_name in sheet_names:
+            with stage(records, sheet_name) as record:
+                frames[sheet_name], parse_reports = _read_sheet(wb[sheet_name], sheet_name, number_format)
+                record['rows_out'] = len(frames[sheet_name])
+
+            stats[sheet_name] = {
+                'rows': record['rows_out'],
+                'seconds': record['seconds'],
+                'peak_mb': record['peak_mb'],
+                'rss_delta_mb': record['rss_delta_mb'],
+                'parse': parse_reports,
+            }
+    finally:
+        wb.close()
+
+    for sheet_name in sheet_names:
+        error_msg = missing_columns_error(frames[sheet_name], sheet_name)
+        if error_msg:
+            return None, None, error_msg, stats
+
+    df_loct = pd.concat(
+        [with_location(frames[sheet_name], sheet_name) for sheet_name in sheet_names[1:]], ignore_index=True
+    )
+    return frames[SO_SHEET], df_loct, None, stats
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Instrumentasi ringan per tahap (pipeline analisis dan dashboard): wall time,
+# baris masuk/keluar, dan memori. Setiap tahap mencatat RSS proses saat ini,
+# perubahannya selama tahap, dan high-water RSS (murah, tanpa tracing). Peak
+# memori per tahap diukur dengan tracemalloc hanya bila sudah aktif (mis.
+# benchmark --memory). Setiap tahap bisa dikirim sebagai log JSON satu baris
+# untuk diagregasi antar sesi.
+
+LOGGER_NAME = 'cek_defisit.metrics'
+# File log metrik (JSON Lines); kosong = stderr
+METRICS_LOG = os.environ.get('SO_METRICS_LOG', '')
+
+# Peak yang sudah terlihat per tahap aktif, per thread (tahap dalam me-reset
+# peak tracemalloc). tracemalloc sendiri global per proses, jadi peak tahap
+# yang berjalan bersamaan di thread lain ikut terhitung.
+_local = threading.local()
+
+
+def _active_peaks():
+    if not hasattr(_local, 'peaks'):
+        _local.peaks = []
+    return _local.peaks
+
+
+def _rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss dalam KB di Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _current_rss_mb():
+    # RSS saat ini (Linux); selain Linux tidak diketahui
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _rows(value):
+    return None if value is None else int(value)
+
+
+@contextmanager
+def stage(records, name, rows_in=None):
+    # Isi record['rows_out'] di dalam blok bila jumlah baris keluar diketahui
+    record = {'stage': name, 'rows_in': _rows(rows_in), 'rows_out': None}
+    tracing = tracemalloc.is_tracing()
+    peaks = _active_peaks()
+    if tracing:
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        peaks.append(0)
+        tracemalloc.reset_peak()
+    rss_before = _current_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        record['rows_out'] = _rows(record['rows_out'])
+        record['peak_mb'] = None
+        if tracing:
+            peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = peak / 1024 ** 2
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+        rss_after = _current_rss_mb()
+        record['rss_delta_mb'] = None if rss_before is None or rss_after is None else rss_after - rss_before
+        record['rss_mb'] = _rss_mb()
+        records.append(record)
+
+
+def get_logger():
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.FileHandler(METRICS_LOG, encoding='utf-8') if METRICS_LOG else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def log_stages(records, **context):
+    # Satu baris JSON per tahap, ditambah konteks (mis. session, file)
+    logger = get_logger()
+    timestamp = time.time()
+    for record in records:
+        logger.info(json.dumps({'event': 'stage', 'ts': timestamp, **context, **record}, default=str))
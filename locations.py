@@ -0,0 +1,257 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from analysis import analyze_frames, build_report_tables, finish_result, preprocess, run_analysis
+from incremental import run_incremental
+from ingest import LOCATION_COLUMN
+from instrument import stage
+from status import classify_kecukupan
+
+# Analisis multi-lokasi: stock dari beberapa sheet Loct_* (atau kolom lokasi)
+# dibagi per lokasi, lalu tiap lokasi dibagi lagi per kelompok Material dan
+# dianalisis di process pool. Semua tahap analisis independen per material,
+# jadi hasil gabungan partisi sama dengan analisis satu proses. Tampilan
+# antar lokasi menunjukkan surplus batch di lokasi lain untuk menutup defisit.
+#
+# SO line dengan lokasi (kolom lokasi di SO_B2B) hanya dianalisis di lokasinya,
+# asalkan nilainya sama dengan salah satu lokasi stock (mis. kolom Plant SAP
+# berisi '1000', bukan 'F211', jadi diabaikan). SO tanpa lokasi yang cocok
+# dianalisis terhadap stock setiap lokasi, sama seperti meng-upload file
+# terpisah per lokasi.
+
+WORKERS = int(os.environ.get('SO_WORKERS', os.cpu_count() or 1))
+# Total SO line minimum untuk memakai process pool (di bawah ini overhead pool lebih besar)
+PARALLEL_MIN_LINES = 200_000
+# Target SO line per partisi material; maksimal PARTS_PER_WORKER partisi per worker
+PARTITION_LINES = 50_000
+PARTS_PER_WORKER = 2
+
+# Nama lokasi untuk frame tanpa kolom Lokasi (mis. dari synthetic.py)
+SINGLE_LOCATION = 'Semua'
+
+CROSS_COLUMNS = [
+    'Lokasi', 'Material', 'Batch', 'Kekurangan', 'Lokasi_Sumber', 'Batch_Sumber', 'Batch_Sama',
+    'Surplus_Sumber', 'Qty_Bisa_Dipindah', 'Status',
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    # Satu pool per proses (dashboard dan CLI); spawn karena server Streamlit multi-thread
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def split_locations(df_so, df_loct):
+    # Hasil: {lokasi: (df_so, df_loct)} tanpa kolom Lokasi, urut nama lokasi
+    if LOCATION_COLUMN not in df_loct.columns:
+        return {SINGLE_LOCATION: (df_so.drop(columns=LOCATION_COLUMN, errors='ignore'), df_loct)}
+
+    stock_location = df_loct[LOCATION_COLUMN]
+    locations = set(stock_location.dropna().unique())
+    so_location = None
+    if LOCATION_COLUMN in df_so.columns:
+        # Lokasi SO yang tidak ada di stock diperlakukan sebagai tanpa lokasi
+        so_location = df_so[LOCATION_COLUMN].where(df_so[LOCATION_COLUMN].isin(locations))
+
+    parts = {}
+    for location in sorted(locations, key=str):
+        so_part = df_so if so_location is None else df_so[(so_location == location) | so_location.isna()]
+        parts[location] = (
+            so_part.drop(columns=LOCATION_COLUMN, errors='ignore'),
+            df_loct[stock_location == location].drop(columns=LOCATION_COLUMN),
+        )
+    return parts
+
+
+def _material_parts(df_so, df_loct, n_parts):
+    # Material diurutkan dari SO line terbanyak lalu dibagi bergiliran, supaya
+    # beban partisi seimbang. Material yang hanya ada di stock masuk partisi 0.
+    counts = df_so['Material'].value_counts(sort=True)
+    part_of = pd.Series(np.arange(len(counts)) % n_parts, index=counts.index)
+    so_part = part_of.reindex(df_so['Material']).to_numpy()
+    loct_part = part_of.reindex(df_loct['Material']).fillna(0).to_numpy()
+    return [(np.flatnonzero(so_part == p), np.flatnonzero(loct_part == p)) for p in range(n_parts)]
+
+
+def _analyze_part(df_so, df_loct, line_priority, batch_order, fill_missing_batch):
+    # Dijalankan di worker; so/loct tidak dikirim balik (sudah ada di proses induk).
+    # Partisi berasal dari frame yang sudah di-preprocess di proses induk
+    frames, has_batch = analyze_frames(df_so, df_loct, line_priority, batch_order, fill_missing_batch,
+                                       preprocessed=True)
+    del frames['so'], frames['loct']
+    return frames, has_batch
+
+
+def _concat_sorted(frames, sort_by):
+    return pd.concat(frames, ignore_index=True).sort_values(sort_by, kind='stable').reset_index(drop=True)
+
+
+def _merge_parts(df_so, df_loct, positions, parts):
+    # Detail dan Line_Index alokasi dikembalikan ke posisi baris df_so lokasi
+    order = np.concatenate(positions)
+    detail = pd.concat([frames['detail'] for frames, _ in parts], ignore_index=True)
+    detail = detail.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    pairs = pd.concat([
+        frames['alokasi_tanpa_batch'].assign(Line_Index=pos[frames['alokasi_tanpa_batch']['Line_Index'].to_numpy()])
+        for pos, (frames, _) in zip(positions, parts)
+    ], ignore_index=True)
+
+    return {
+        'so': df_so,
+        'loct': df_loct,
+        'cube': pd.concat([frames['cube'] for frames, _ in parts]).sort_index(),
+        'material': pd.concat([frames['material'] for frames, _ in parts]).sort_index(),
+        'detail': detail,
+        'alokasi_tanpa_batch': pairs.sort_values('Line_Index', kind='stable').reset_index(drop=True),
+        'deficit': _concat_sorted([frames['deficit'] for frames, _ in parts], ['Material', 'Batch']),
+        'substitusi': _concat_sorted(
+            [frames['substitusi'] for frames, _ in parts], ['Material', 'Status', 'Sisa_Stock_Bisa_Pakai']
+        ),
+    }
+
+
+def run_partitioned(df_so, df_loct, line_priority=('Shipment Number',), batch_order='Batch', compact=False,
+                    preprocessed=False, workers=WORKERS):
+    # Seperti run_analysis, tetapi partisi material dianalisis di process pool
+    if workers <= 1 or df_so['Material'].nunique() <= 1:
+        return run_analysis(df_so, df_loct, line_priority, batch_order, compact, preprocessed)
+
+    stages = []
+    if not preprocessed:
+        with stage(stages, 'preprocessing', rows_in=len(df_so) + len(df_loct)) as record:
+            df_so, df_loct = preprocess(df_so, df_loct)
+            record['rows_out'] = len(df_so) + len(df_loct)
+
+    n_parts = max(1, min(workers * PARTS_PER_WORKER, -(-len(df_so) // PARTITION_LINES), df_so['Material'].nunique()))
+    with stage(stages, 'partitions', rows_in=len(df_so)) as record:
+        partitions = _material_parts(df_so, df_loct, n_parts)
+        pool = _get_pool(workers)
+        try:
+            futures = [
+                pool.submit(_analyze_part, df_so.iloc[so_pos].reset_index(drop=True),
+                            df_loct.iloc[loct_pos].reset_index(drop=True), line_priority, batch_order, not compact)
+                for so_pos, loct_pos in partitions
+            ]
+            parts = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # Worker mati (mis. kehabisan memori); pool dibuat ulang di pemanggilan berikutnya
+            _reset_pool()
+            raise
+        record['rows_out'] = n_parts
+
+    with stage(stages, 'merge', rows_in=sum(len(frames['detail']) for frames, _ in parts)) as record:
+        frames = _merge_parts(df_so, df_loct, [so_pos for so_pos, _ in partitions], parts)
+        record['rows_out'] = len(frames['detail'])
+
+    return finish_result(frames, any(has_batch for _, has_batch in parts), stages, compact)
+
+
+def cross_location(results):
+    # Untuk setiap batch defisit: batch material yang sama di lokasi lain yang
+    # masih surplus setelah dipakai SO lokasinya sendiri (batch sama diurutkan dulu)
+    if len(results) < 2:
+        return pd.DataFrame(columns=CROSS_COLUMNS)
+
+    deficits = pd.concat([
+        result['deficit'][['Material', 'Batch', 'Balance']].astype({'Material': object, 'Batch': object})
+        .assign(Lokasi=location)
+        for location, result in results.items()
+    ], ignore_index=True)
+    surplus = pd.concat([
+        result['cube'].loc[result['cube']['Sisa_Stock'] > 0, ['Sisa_Stock']].reset_index()
+        .astype({'Material': object, 'Batch': object})
+        .rename(columns={'Batch': 'Batch_Sumber', 'Sisa_Stock': 'Surplus_Sumber'})
+        .assign(Lokasi_Sumber=location)
+        for location, result in results.items()
+    ], ignore_index=True)
+
+    cross = deficits.merge(surplus, on='Material')
+    cross = cross[cross['Lokasi'] != cross['Lokasi_Sumber']].reset_index(drop=True)
+    cross['Kekurangan'] = -cross['Balance']
+    cross['Batch_Sama'] = cross['Batch'] == cross['Batch_Sumber']
+    cross['Qty_Bisa_Dipindah'] = np.minimum(cross['Surplus_Sumber'], cross['Kekurangan'])
+    cross['Status'] = classify_kecukupan(cross['Surplus_Sumber'], cross['Kekurangan'])
+    cross = cross.sort_values(
+        ['Lokasi', 'Material', 'Batch', 'Batch_Sama', 'Surplus_Sumber'],
+        ascending=[True, True, True, False, False], kind='stable'
+    )
+    return cross[CROSS_COLUMNS].reset_index(drop=True)
+
+
+def run_locations(df_so, df_loct, previous=None, line_priority=('Shipment Number',), batch_order='Batch',
+                  compact=False, workers=WORKERS):
+    # Hasil: {'locations': {lokasi: hasil run_incremental}, 'cross', 'stages', 'seconds'}.
+    # previous = hasil run_locations upload sebelumnya (inkremental per lokasi).
+    start = time.perf_counter()
+    parts = split_locations(df_so, df_loct)
+    if sum(len(so_part) for so_part, _ in parts.values()) < PARALLEL_MIN_LINES:
+        workers = 1
+    previous_locations = previous['locations'] if previous is not None else {}
+    analyze = partial(run_partitioned, workers=workers)
+
+    def run_location(location):
+        so_part, loct_part = parts[location]
+        return run_incremental(
+            so_part, loct_part, previous_locations.get(location), line_priority, batch_order, compact, analyze
+        )
+
+    # Lokasi berjalan bersamaan; pekerjaan beratnya ada di process pool
+    if workers > 1 and len(parts) > 1:
+        with ThreadPoolExecutor(max_workers=min(len(parts), workers)) as threads:
+            results = dict(zip(parts, threads.map(run_location, parts)))
+    else:
+        results = {location: run_location(location) for location in parts}
+
+    stages = [
+        {**record, 'stage': record['stage'] if len(results) == 1 else f"{location}/{record['stage']}"}
+        for location, result in results.items() for record in result['stages']
+    ]
+    with stage(stages, 'cross_location', rows_in=sum(len(result['deficit']) for result in results.values())) as record:
+        cross = cross_location(results)
+        record['rows_out'] = len(cross)
+
+    return {
+        'locations': results,
+        'cross': cross,
+        'stages': stages,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def build_location_report_tables(analysis):
+    # Tabel report semua lokasi; satu lokasi -> sama persis dengan build_report_tables
+    results = analysis['locations']
+    if len(results) == 1:
+        return build_report_tables(next(iter(results.values())))
+
+    tables = {}
+    for location, result in results.items():
+        for name, df in build_report_tables(result).items():
+            df = df.copy()
+            df.insert(0, LOCATION_COLUMN, location)
+            tables.setdefault(name, []).append(df)
+    tables = {name: pd.concat(frames, ignore_index=True) for name, frames in tables.items()}
+    tables['antar_lokasi'] = analysis['cross']
+    return tables
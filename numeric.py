@@ -0,0 +1,104 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Parsing kolom angka (Ordered Quantity, Unrestricted) per kolom sekaligus.
+# Pemisah ribuan/desimal dideteksi otomatis dari isi kolom (format EN
+# "1,234.5" atau ID "1.234,5") atau ditentukan manual, dan baris yang gagal
+# diparsing dilaporkan, bukan hilang diam-diam menjadi NaN.
+
+# format -> (pemisah ribuan, pemisah desimal); None = deteksi otomatis
+NUMBER_FORMATS = {
+    'auto': None,
+    'en': (',', '.'),
+    'id': ('.', ','),
+}
+
+# Jumlah contoh baris gagal parsing yang disimpan di laporan
+SAMPLE_SIZE = 5
+
+_THOUSANDS_ONLY = {
+    ',': r'[+-]?\d{1,3}(,\d{3})+-?',
+    '.': r'[+-]?\d{1,3}(\.\d{3})+-?',
+}
+
+# Teks angka yang sudah dinormalisasi dan aman di-cast langsung oleh Arrow
+_PLAIN_NUMBER = r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?'
+
+
+def format_name(thousands, decimal):
+    # Kebalikan NUMBER_FORMATS: (ribuan, desimal) -> nama format
+    return next(name for name, seps in NUMBER_FORMATS.items() if seps == (thousands, decimal))
+
+
+# Spasi yang dibuang sebelum parsing; NBSP (U+00A0) dan narrow NBSP (U+202F)
+# dipakai sebagai pemisah ribuan di export ID/EU dan tidak termasuk \s Arrow
+_SPACES = '[\\s\u00a0\u202f]'
+
+
+def detect_separators(text):
+    # Hitung bukti untuk tiap format. Hasil None bila tidak ada bukti yang
+    # memenangkan salah satu format (mis. "1,234" atau "1.000" saja)
+    has_dot = text.str.contains('.', regex=False)
+    has_comma = text.str.contains(',', regex=False)
+    both = has_dot & has_comma
+    comma_last = text.str.contains(r',[^.]*$')
+
+    votes_id = (
+        (both & comma_last).sum()
+        + (has_comma & ~has_dot & ~text.str.fullmatch(_THOUSANDS_ONLY[','])).sum()
+        + text.str.contains(r'\..*\.').sum()
+    )
+    votes_en = (
+        (both & ~comma_last).sum()
+        + (has_dot & ~has_comma & ~text.str.fullmatch(_THOUSANDS_ONLY['.'])).sum()
+        + text.str.contains(r',.*,').sum()
+    )
+    if votes_id == votes_en:
+        return None
+    return NUMBER_FORMATS['id'] if votes_id > votes_en else NUMBER_FORMATS['en']
+
+
+def parse_number_column(series, number_format='auto'):
+    # Hasil: Series float64 dan laporan {'coerced', 'sample', 'thousands', 'decimal'}
+    report = {'column': series.name, 'coerced': 0, 'sample': [], 'thousands': None, 'decimal': None}
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64'), report
+
+    # Nilai angka asli dari Excel tidak disentuh, hanya teks yang diparsing
+    if pd.api.types.is_string_dtype(series) and series.dtype != object:
+        is_text = series.notna()
+        values = pd.Series(float('nan'), index=series.index)
+    else:
+        is_text = series.map(type) == str
+        values = pd.to_numeric(series.where(~is_text), errors='coerce').astype('float64')
+
+    text = series[is_text].astype('str').str.replace(_SPACES, '', regex=True)
+    if text.empty:
+        return values, report
+
+    # Tanpa bukti: parsing memakai format EN (perilaku lama: koma = ribuan),
+    # tetapi format tidak dilaporkan sehingga chunk/kolom berikutnya tetap dideteksi
+    separators = NUMBER_FORMATS[number_format] or detect_separators(text)
+    if separators is not None:
+        report['thousands'], report['decimal'] = separators
+    thousands, decimal = separators or NUMBER_FORMATS['en']
+
+    normalized = text.str.replace(thousands, '', regex=False).str.replace(decimal, '.', regex=False)
+    if normalized.str.endswith('-').any():
+        # Format negatif SAP: "123-" -> "-123"
+        normalized = normalized.str.replace(r'^(.*)-$', r'-\1', regex=True)
+    # Hanya teks berbentuk angka yang di-cast (Arrow, jauh lebih cepat dari to_numeric)
+    valid = normalized.str.fullmatch(_PLAIN_NUMBER).fillna(False)
+    parsed = pd.Series(float('nan'), index=normalized.index)
+    parsed[valid] = pc.cast(pa.array(normalized[valid], type=pa.string()), pa.float64()).to_numpy(zero_copy_only=False)
+    values[is_text] = parsed.to_numpy()
+
+    # Teks kosong memang kosong, bukan gagal parsing
+    failed = parsed.isna() & (text != '')
+    report['coerced'] = int(failed.sum())
+    report['sample'] = [
+        {'row': int(idx), 'value': series.loc[idx]}
+        for idx in failed[failed].index[:SAMPLE_SIZE]
+    ]
+    return values, report
@@ -0,0 +1,256 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from analysis import TANPA_BATCH, is_tanpa_batch
+from sku_index import build_offsets
+from status import classify_balance
+
+# Skenario what-if pemindahan batch: planner memindahkan SO line ke batch lain
+# (atau menerapkan saran batch untuk line tanpa batch) tanpa mengedit Excel dan
+# upload ulang. Qty SO per (Material, Batch) disimpan sebagai array sejajar
+# index cube; setiap edit hanya mengurangi qty di batch lama dan menambahkannya
+# di batch baru untuk line yang dipindah, jadi biayanya sebanding jumlah line
+# yang diedit, bukan ukuran file. Edit disimpan di stack untuk undo/redo.
+#
+# Saldo skenario = Stock - Qty_SO per batch (seperti tab 1). Alokasi berurutan
+# per line tidak dihitung ulang; itu terjadi saat file hasil perubahan di-upload.
+
+NO_BATCH = -1
+# Jumlah edit yang bisa di-undo
+UNDO_LIMIT = 50
+
+ASSIGNMENT_COLUMNS = ['Line', 'Shipment Number', 'Material', 'Ordered Quantity', 'Batch_Awal', 'Batch_Baru']
+BALANCE_COLUMNS = ['Material', 'Batch', 'Stock', 'Qty_SO_Awal', 'Qty_SO', 'Sisa_Stock_Awal', 'Sisa_Stock', 'Status']
+DEFICIT_COLUMNS = ['Material', 'Batch', 'Total_Ordered', 'Stock_Onhand', 'Balance']
+
+
+def new_scenario(result):
+    # Skenario kosong (tanpa edit) untuk satu hasil analysis; array di sini milik
+    # skenario, frame hasil analysis tidak diubah
+    cube = result['cube']
+    detail = result['detail']
+    batches = detail['Batch Number']
+    codes = cube.index.get_indexer(pd.MultiIndex.from_arrays([detail['Material'], batches]))
+    codes[is_tanpa_batch(batches).to_numpy()] = NO_BATCH
+
+    # Line dan batch per material, untuk pilihan di form edit (argsort kode
+    # integer hasil factorize jauh lebih cepat daripada argsort string)
+    material_codes, material_names = pd.factorize(detail['Material'], sort=True)
+    line_order = np.argsort(material_codes, kind='stable')
+    counts = np.bincount(material_codes, minlength=len(material_names))
+    stops = np.cumsum(counts)
+    line_offsets = dict(zip(np.asarray(material_names, dtype=object).tolist(),
+                            zip((stops - counts).tolist(), stops.tolist())))
+    key_materials = cube.index.get_level_values('Material').to_numpy(dtype=object)
+
+    qty_so = cube['Qty_SO'].to_numpy(dtype='float64')
+    baris_so = cube['Baris_SO'].to_numpy(dtype='int64')
+    return {
+        'key_materials': key_materials,
+        'key_batches': cube.index.get_level_values('Batch').to_numpy(dtype=object),
+        'key_offsets': build_offsets(key_materials),
+        'stock': cube['Stock'].to_numpy(dtype='float64'),
+        'qty_so_base': qty_so,
+        'baris_so_base': baris_so,
+        'qty_so': qty_so.copy(),
+        'baris_so': baris_so.copy(),
+        'line_materials': detail['Material'].to_numpy(dtype=object),
+        'line_qty': np.nan_to_num(detail['Ordered Quantity'].to_numpy(dtype='float64')),
+        'line_order': line_order,
+        'line_offsets': line_offsets,
+        'codes_base': codes,
+        'codes': codes.copy(),
+        'undo': [],
+        'redo': [],
+    }
+
+
+def lines_for_material(scenario, material):
+    start, stop = scenario['line_offsets'].get(material, (0, 0))
+    return scenario['line_order'][start:stop]
+
+
+def key_code(scenario, material, batch):
+    # Posisi (Material, Batch) di cube; batch harus sudah ada untuk material itu
+    if batch is None:
+        return NO_BATCH
+    start, stop = scenario['key_offsets'].get(material, (0, 0))
+    match = np.flatnonzero(scenario['key_batches'][start:stop] == batch)
+    if not len(match):
+        raise ValueError(f"Batch {batch} tidak ada untuk material {material}")
+    return start + int(match[0])
+
+
+def _move(scenario, before, after, lines):
+    # Pindahkan qty line dari batch `before` ke `after`; hanya batch terdampak yang berubah
+    qty = scenario['line_qty'][lines]
+    for codes, sign in ((before, -1), (after, 1)):
+        valid = codes != NO_BATCH
+        np.add.at(scenario['qty_so'], codes[valid], sign * qty[valid])
+        np.add.at(scenario['baris_so'], codes[valid], sign)
+    scenario['codes'][lines] = after
+
+
+def _affected_keys(before, after):
+    keys = np.union1d(before, after)
+    return keys[keys != NO_BATCH]
+
+
+def apply_codes(scenario, lines, codes, label):
+    # Satu edit (bisa banyak line). Hasil: jumlah line yang benar-benar berubah.
+    lines = np.asarray(lines, dtype='int64')
+    codes = np.broadcast_to(np.asarray(codes, dtype='int64'), lines.shape)
+    changed = scenario['codes'][lines] != codes
+    lines, after = lines[changed], codes[changed].copy()
+    if not len(lines):
+        return 0
+
+    before = scenario['codes'][lines].copy()
+    keys = _affected_keys(before, after)
+    # Nilai lama batch terdampak disimpan persis, supaya undo tidak menumpuk selisih float
+    scenario['undo'].append({
+        'label': label, 'lines': lines, 'before': before, 'after': after, 'keys': keys,
+        'qty_so': scenario['qty_so'][keys].copy(), 'baris_so': scenario['baris_so'][keys].copy(),
+    })
+    del scenario['undo'][:-UNDO_LIMIT]
+    scenario['redo'].clear()
+    _move(scenario, before, after, lines)
+    return len(lines)
+
+
+def reassign(scenario, lines, material, batch):
+    # Pindahkan line (posisi baris detail) material ini ke batch lain; batch=None -> tanpa batch
+    lines = np.asarray(lines, dtype='int64')
+    if (scenario['line_materials'][lines] != material).any():
+        raise ValueError(f"Semua line harus material {material}")
+    return apply_codes(scenario, lines, key_code(scenario, material, batch),
+                       f"{len(lines):,} line {material} -> {batch or TANPA_BATCH}")
+
+
+def suggested_codes(scenario, alokasi_tanpa_batch):
+    # Saran untuk line yang saat ini tanpa batch: batch dengan Qty_Alokasi
+    # terbesar (satu line tidak dipecah ke beberapa batch). Hasil: (lines, codes).
+    pairs = alokasi_tanpa_batch[alokasi_tanpa_batch['Qty_Alokasi'] > 0]
+    pairs = pairs.sort_values(['Line_Index', 'Qty_Alokasi'], ascending=[True, False], kind='stable')
+    pairs = pairs.drop_duplicates('Line_Index')
+    lines = pairs['Line_Index'].to_numpy(dtype='int64')
+    codes = pd.MultiIndex.from_arrays([scenario['key_materials'], scenario['key_batches']]).get_indexer(
+        pd.MultiIndex.from_arrays([scenario['line_materials'][lines], pairs['Batch'].to_numpy(dtype=object)])
+    )
+    keep = (codes != NO_BATCH) & (scenario['codes'][lines] == NO_BATCH)
+    return lines[keep], codes[keep]
+
+
+def apply_suggestions(scenario, alokasi_tanpa_batch):
+    lines, codes = suggested_codes(scenario, alokasi_tanpa_batch)
+    return apply_codes(scenario, lines, codes, f"Saran batch untuk {len(lines):,} line tanpa batch")
+
+
+def reset(scenario):
+    # Kembali ke assignment awal sebagai satu edit (bisa di-undo)
+    lines = changed_lines(scenario)
+    return apply_codes(scenario, lines, scenario['codes_base'][lines], "Reset ke assignment awal")
+
+
+def undo(scenario):
+    if not scenario['undo']:
+        return None
+    edit = scenario['undo'].pop()
+    scenario['codes'][edit['lines']] = edit['before']
+    scenario['qty_so'][edit['keys']] = edit['qty_so']
+    scenario['baris_so'][edit['keys']] = edit['baris_so']
+    scenario['redo'].append(edit)
+    return edit['label']
+
+
+def redo(scenario):
+    if not scenario['redo']:
+        return None
+    edit = scenario['redo'].pop()
+    _move(scenario, edit['before'], edit['after'], edit['lines'])
+    scenario['undo'].append(edit)
+    return edit['label']
+
+
+def changed_lines(scenario):
+    return np.flatnonzero(scenario['codes'] != scenario['codes_base'])
+
+
+def assignment_digest(scenario):
+    # Key cache export: sama untuk assignment yang sama, di sesi mana pun
+    return hashlib.sha256(scenario['codes'].tobytes()).hexdigest()[:16]
+
+
+def batch_labels(scenario, codes):
+    labels = scenario['key_batches'][np.maximum(codes, 0)].copy()
+    labels[codes == NO_BATCH] = TANPA_BATCH
+    return labels
+
+
+def assignment_table(scenario, detail):
+    # Line yang batch-nya berubah dibanding file (Line = posisi baris SO_B2B, mulai 1)
+    lines = changed_lines(scenario)
+    rows = detail.iloc[lines]
+    return pd.DataFrame({
+        'Line': lines + 1,
+        'Shipment Number': rows['Shipment Number'].to_numpy(),
+        'Material': rows['Material'].to_numpy(),
+        'Ordered Quantity': rows['Ordered Quantity'].to_numpy(),
+        'Batch_Awal': batch_labels(scenario, scenario['codes_base'][lines]),
+        'Batch_Baru': batch_labels(scenario, scenario['codes'][lines]),
+    }, columns=ASSIGNMENT_COLUMNS)
+
+
+def balance_table(scenario, keys):
+    # Saldo awal vs skenario untuk posisi cube `keys`
+    sisa = scenario['stock'][keys] - scenario['qty_so'][keys]
+    return pd.DataFrame({
+        'Material': scenario['key_materials'][keys],
+        'Batch': scenario['key_batches'][keys],
+        'Stock': scenario['stock'][keys],
+        'Qty_SO_Awal': scenario['qty_so_base'][keys],
+        'Qty_SO': scenario['qty_so'][keys],
+        'Sisa_Stock_Awal': scenario['stock'][keys] - scenario['qty_so_base'][keys],
+        'Sisa_Stock': sisa,
+        'Status': classify_balance(sisa),
+    }, columns=BALANCE_COLUMNS)
+
+
+def affected_balances(scenario):
+    # Batch asal dan tujuan semua line yang berubah
+    lines = changed_lines(scenario)
+    return balance_table(scenario, _affected_keys(scenario['codes_base'][lines], scenario['codes'][lines]))
+
+
+def material_batches(scenario, material):
+    start, stop = scenario['key_offsets'].get(material, (0, 0))
+    return balance_table(scenario, np.arange(start, stop))
+
+
+def _deficit_mask(scenario, qty_so, baris_so):
+    return (baris_so > 0) & (scenario['stock'] - qty_so < 0)
+
+
+def scenario_deficit(scenario):
+    # Sama seperti tabel defisit tab 1, dengan Qty_SO skenario
+    keys = np.flatnonzero(_deficit_mask(scenario, scenario['qty_so'], scenario['baris_so']))
+    return pd.DataFrame({
+        'Material': scenario['key_materials'][keys],
+        'Batch': scenario['key_batches'][keys],
+        'Total_Ordered': scenario['qty_so'][keys],
+        'Stock_Onhand': scenario['stock'][keys],
+        'Balance': scenario['stock'][keys] - scenario['qty_so'][keys],
+    }, columns=DEFICIT_COLUMNS)
+
+
+def scenario_summary(scenario):
+    summary = {}
+    for suffix, qty_so, baris_so in (('awal', scenario['qty_so_base'], scenario['baris_so_base']),
+                                     ('skenario', scenario['qty_so'], scenario['baris_so'])):
+        mask = _deficit_mask(scenario, qty_so, baris_so)
+        summary[f'batch_defisit_{suffix}'] = int(mask.sum())
+        summary[f'qty_defisit_{suffix}'] = float((qty_so[mask] - scenario['stock'][mask]).sum())
+    summary['line_dipindah'] = len(changed_lines(scenario))
+    return summary
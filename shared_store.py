@@ -0,0 +1,102 @@
+import threading
+import weakref
+from types import MappingProxyType
+
+import pandas as pd
+
+from compact import frame_mb
+
+# Satu instance data (hasil load dan hasil analisis) per isi file + parameter,
+# dipakai bersama oleh semua sesi dashboard di proses ini. Berbeda dengan
+# st.cache_data, nilai tidak dipickle/dicopy per pemanggil: setiap sesi
+# menerima objek yang sama. Frame dianggap read-only (copy-on-write pandas),
+# jadi filter/assign di sesi hanya membuat frame baru milik sesi itu.
+# Dataset dilepas dari memori begitu tidak ada sesi yang memakainya lagi.
+
+if int(pd.__version__.split('.')[0]) < 3:
+    # pandas 3 selalu copy-on-write
+    pd.set_option('mode.copy_on_write', True)
+
+_lock = threading.Lock()
+# key (jenis, file_hash, parameter...) -> {'lock', 'value', 'ready', 'sessions': set(session_id), 'mb'}
+_entries = {}
+
+
+def _freeze(value):
+    # dict hasil analysis -> mapping read-only; frame di dalamnya tetap (CoW)
+    if isinstance(value, dict):
+        return MappingProxyType(value)
+    return value
+
+
+def _frames(value):
+    values = value.values() if isinstance(value, (dict, MappingProxyType)) else value
+    return [v for v in values if isinstance(v, pd.DataFrame)]
+
+
+def _release(key, session_id):
+    # Dipanggil dengan _lock terpegang
+    entry = _entries.get(key)
+    if entry is None:
+        return
+    entry['sessions'].discard(session_id)
+    if not entry['sessions']:
+        del _entries[key]
+
+
+def acquire(key, session_id, build):
+    # Nilai bersama untuk key; build() hanya dijalankan sekali walau banyak
+    # sesi meminta key yang sama bersamaan (sesi lain menunggu hasilnya)
+    with _lock:
+        entry = _entries.setdefault(key, {
+            'lock': threading.Lock(), 'value': None, 'ready': False, 'sessions': set(), 'mb': None
+        })
+        entry['sessions'].add(session_id)
+
+    with entry['lock']:
+        if not entry['ready']:
+            try:
+                value = _freeze(build())
+            except BaseException:
+                with _lock:
+                    _release(key, session_id)
+                raise
+            entry['mb'] = sum(frame_mb(df) for df in _frames(value))
+            entry['value'] = value
+            entry['ready'] = True
+    return entry['value']
+
+
+def retain(session_id, keys):
+    # Lepas semua dataset sesi ini kecuali yang ada di keys
+    keys = set(keys)
+    with _lock:
+        for key in [k for k, entry in _entries.items() if session_id in entry['sessions'] and k not in keys]:
+            _release(key, session_id)
+
+
+def release_session(session_id):
+    retain(session_id, ())
+
+
+def register_session(session_state, session_id):
+    # Dataset sesi dilepas saat session state-nya dibuang (tab ditutup dan
+    # sesi kedaluwarsa), walau tidak ada rerun terakhir yang memanggil retain
+    if '_shared_store_lease' not in session_state:
+        session_state['_shared_store_lease'] = _Lease(session_id)
+
+
+class _Lease:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        weakref.finalize(self, release_session, session_id)
+
+
+def store_stats():
+    # Untuk panel debug: satu baris per dataset yang sedang dipegang
+    with _lock:
+        return pd.DataFrame(
+            [{'dataset': key[0], 'file': key[1][:12], 'sessions': len(entry['sessions']), 'mb': entry['mb']}
+             for key, entry in _entries.items()],
+            columns=['dataset', 'file', 'sessions', 'mb']
+        )
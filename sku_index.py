@@ -0,0 +1,27 @@
+import numpy as np
+
+# Index per Material untuk tampilan satu SKU (tab 3): frame diurutkan sekali
+# per Material, lalu posisi awal/akhir tiap material disimpan di dict. Lookup
+# cukup memotong baris material itu (iloc), bukan memindai seluruh frame.
+
+
+def build_offsets(materials):
+    # materials sudah terurut; hasil dict material -> (awal, akhir)
+    values = np.asarray(materials, dtype=object)
+    if len(values) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])
+    stops = np.r_[starts[1:], len(values)]
+    return dict(zip(values[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+
+def build_sku_index(df, sort_by=('Material',)):
+    # Kolom pertama sort_by harus Material; kolom berikutnya = urutan baris dalam satu SKU
+    df = df.sort_values(list(sort_by), kind='stable').reset_index(drop=True)
+    return {'frame': df, 'offsets': build_offsets(df['Material'])}
+
+
+def rows_for_material(index, material):
+    # Frame kosong (dengan kolom lengkap) bila material tidak ada
+    start, stop = index['offsets'].get(material, (0, 0))
+    return index['frame'].iloc[start:stop]
@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from ingest import read_workbook
+
+# Cache snapshot di disk: frame SO_B2B / stock (semua sheet Loct_*) hasil parsing disimpan
+# sebagai Arrow IPC (Feather v2, tanpa kompresi) per hash isi file, lalu
+# di-memory-map saat dibaca ulang. Ukuran cache dibatasi dengan eviksi LRU.
+
+CACHE_DIR = os.environ.get('SO_CACHE_DIR', os.path.join('.cache', 'snapshots'))
+CACHE_MAX_BYTES = int(os.environ.get('SO_CACHE_MAX_MB', '2048')) * 1024 ** 2
+
+# Naikkan bila isi/format snapshot berubah (snapshot lama tidak dipakai lagi)
+SNAPSHOT_VERSION = 4
+
+FRAME_FILES = {
+    'so': 'so_b2b.arrow',
+    'loct': 'loct.arrow',
+}
+# Jumlah baris dan laporan parsing angka per sheet, supaya tetap tampil saat dibaca dari cache
+META_FILE = 'meta.json'
+
+
+def snapshot_key(file_hash, number_format='auto'):
+    # Frame tersimpan sudah numerik, jadi format angka ikut menjadi bagian key
+    return f"{file_hash}-{number_format}-v{SNAPSHOT_VERSION}"
+
+
+def has_snapshot(file_hash, number_format='auto', cache_dir=CACHE_DIR):
+    return os.path.isdir(_snapshot_dir(snapshot_key(file_hash, number_format), cache_dir))
+
+
+def _snapshot_dir(file_hash, cache_dir):
+    return os.path.join(cache_dir, file_hash)
+
+
+def _to_arrow_safe(df):
+    # Kolom object bertipe campuran tidak bisa disimpan Arrow; simpan sebagai teks
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def _entry_size(entry):
+    if entry.is_dir():
+        return sum(sub.stat().st_size for sub in os.scandir(entry.path) if sub.is_file())
+    return entry.stat().st_size
+
+
+def load_snapshot(file_hash, cache_dir=CACHE_DIR):
+    path = _snapshot_dir(file_hash, cache_dir)
+    if not os.path.isdir(path):
+        return None
+
+    try:
+        frames = {
+            name: feather.read_table(os.path.join(path, file_name), memory_map=True).to_pandas()
+            for name, file_name in FRAME_FILES.items()
+        }
+        with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError, pa.ArrowInvalid):
+        # Snapshot rusak/tidak lengkap: abaikan dan parsing ulang dari xlsx
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    # Tandai sebagai baru dipakai untuk urutan LRU
+    os.utime(path)
+    return frames['so'], frames['loct'], meta
+
+
+def save_snapshot(file_hash, df_so, df_loct, meta=None, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    path = _snapshot_dir(file_hash, cache_dir)
+    if os.path.isdir(path):
+        os.utime(path)
+        return
+
+    # Tulis ke folder sementara lalu rename, supaya pembaca lain tidak melihat
+    # snapshot setengah jadi
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    try:
+        for name, df in (('so', df_so), ('loct', df_loct)):
+            feather.write_feather(
+                _to_arrow_safe(df),
+                os.path.join(tmp_path, FRAME_FILES[name]),
+                compression='uncompressed'
+            )
+        with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta or {}, f, default=str)
+        os.replace(tmp_path, path)
+    except (OSError, pa.ArrowException):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+    evict(cache_dir, max_bytes, keep=file_hash)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=None):
+    # Hapus entri (folder snapshot atau file) yang paling lama tidak dipakai
+    # sampai total ukuran <= max_bytes
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if '.tmp-' not in entry.name:
+            entries.append((entry.stat().st_mtime, entry.name, _entry_size(entry), entry.is_dir()))
+
+    total = sum(size for _, _, size, _ in entries)
+    evicted = []
+    for _, name, size, is_dir in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        path = os.path.join(cache_dir, name)
+        if is_dir:
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+        total -= size
+        evicted.append(name)
+    return evicted
+
+
+def read_workbook_cached(file, file_hash, cache_dir=CACHE_DIR, number_format='auto'):
+    # Sama seperti ingest.read_workbook, tetapi memakai snapshot di disk bila ada.
+    # file=None -> hanya dari snapshot (error bila snapshot tidak ada)
+    key = snapshot_key(file_hash, number_format)
+    start = time.perf_counter()
+    cached = load_snapshot(key, cache_dir)
+    if cached is not None:
+        df_so, df_loct, meta = cached
+        seconds = time.perf_counter() - start
+        stats = {
+            sheet_name: {
+                'rows': sheet_meta['rows'],
+                'seconds': seconds,
+                'peak_mb': None,
+                'rss_delta_mb': None,
+                'parse': sheet_meta['parse'],
+                'source': 'cache',
+            }
+            for sheet_name, sheet_meta in meta.items()
+        }
+        return df_so, df_loct, None, stats
+    if file is None:
+        return None, None, f"Snapshot {file_hash[:12]} (format angka {number_format}) tidak ada di cache", {}
+
+    df_so, df_loct, error_msg, stats = read_workbook(file, number_format=number_format)
+    if error_msg is None:
+        meta = {sheet_name: {'rows': stat['rows'], 'parse': stat['parse']} for sheet_name, stat in stats.items()}
+        try:
+            save_snapshot(key, df_so, df_loct, meta, cache_dir)
+        except (OSError, pa.ArrowException):
+            # Cache hanya optimasi; disk penuh/read-only tidak boleh menggagalkan load
+            pass
+    for stat in stats.values():
+        stat['source'] = 'xlsx'
+    return df_so, df_loct, error_msg, stats
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+# Klasifikasi status stock yang dipakai semua tab. Semua fungsi bekerja
+# per kolom sekaligus (vectorized) dan mengembalikan kolom categorical,
+# bukan string emoji yang diulang di setiap baris.
+
+DEFISIT = "❌ DEFISIT"
+PAS = "⚠️ PAS"
+SURPLUS = "✅ SURPLUS"
+TANPA_BATCH = "⚠️ TANPA BATCH"
+
+CUKUP = "✅ CUKUP"
+KURANG = "⚠️ KURANG"
+TIDAK_ADA_STOCK = "❌ TIDAK ADA STOCK"
+
+TOTAL_CUKUP = "✅ TOTAL STOCK CUKUP"
+TOTAL_KURANG = "⚠️ TOTAL STOCK KURANG"
+
+# Perubahan defisit dibanding upload sebelumnya
+DEFISIT_BARU = "🆕 DEFISIT BARU"
+DEFISIT_BERUBAH = "🔁 DEFISIT BERUBAH"
+DEFISIT_SELESAI = "✅ DEFISIT SELESAI"
+
+# Urutan kategori = urutan prioritas saat sorting (paling kritis dulu)
+STATUS_CATEGORIES = [DEFISIT, PAS, SURPLUS, TANPA_BATCH]
+KECUKUPAN_CATEGORIES = [TIDAK_ADA_STOCK, KURANG, CUKUP]
+TOTAL_CATEGORIES = [TOTAL_KURANG, TOTAL_CUKUP]
+PERUBAHAN_CATEGORIES = [DEFISIT_BARU, DEFISIT_BERUBAH, DEFISIT_SELESAI]
+
+
+def _categorical(codes, categories, index):
+    return pd.Series(pd.Categorical.from_codes(codes, categories=categories), index=index)
+
+
+def _values(x):
+    return np.asarray(x, dtype='float64')
+
+
+def classify_balance(balance, tanpa_batch=None):
+    # balance < 0 -> DEFISIT, == 0 -> PAS, lainnya (termasuk NaN) -> SURPLUS
+    values = _values(balance)
+    codes = np.select([values < 0, values == 0], [0, 1], default=2)
+    if tanpa_batch is not None:
+        codes = np.where(np.asarray(tanpa_batch, dtype=bool), 3, codes)
+    return _categorical(codes, STATUS_CATEGORIES, getattr(balance, 'index', None))
+
+
+def classify_kecukupan(stock, qty, no_stock=None):
+    # Cukup bila stock batch >= qty yang dibutuhkan line
+    codes = np.where(_values(stock) >= _values(qty), 2, 1)
+    if no_stock is not None:
+        codes = np.where(np.asarray(no_stock, dtype=bool), 0, codes)
+    return _categorical(codes, KECUKUPAN_CATEGORIES, getattr(stock, 'index', None))
+
+
+def classify_total_stock(stock, qty):
+    codes = np.where(_values(stock) >= _values(qty), 1, 0)
+    return _categorical(codes, TOTAL_CATEGORIES, getattr(stock, 'index', None))
+
+
+def classify_perubahan(before, after):
+    # before/after: batch defisit di upload sebelumnya / sekarang (boolean)
+    before = np.asarray(before, dtype=bool)
+    after = np.asarray(after, dtype=bool)
+    codes = np.select([~before, after], [0, 1], default=2)
+    return _categorical(codes, PERUBAHAN_CATEGORIES, None)
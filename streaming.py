@@ -0,0 +1,125 @@
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from analysis import (build_deficit, build_detail, build_substitution, deficit_batches, deficit_shipments,
+                      is_tanpa_batch, preprocess_loct, preprocess_so)
+from cube import aggregate_demand, aggregate_stock, combine_cube, merge_demand
+from ingest import LOCATION_COLUMN, iter_sheet_chunks, missing_columns_error, open_workbook, stock_sheets
+from status import DEFISIT
+
+# Mode streaming (out-of-core) untuk SO_B2B yang tidak muat di RAM:
+# Loct_F211 (jauh lebih kecil) dibaca utuh dan diagregasi sekali, SO_B2B
+# dibaca per chunk. Tiap chunk di-join ke agregat stock, demand per
+# (Material, Batch) diakumulasi, dan detail per line ditulis ke Parquet di
+# disk. Memori puncak ~ satu chunk + agregat per (Material, Batch).
+#
+# Hasil defisit & substitusi sama dengan tab 1. Kolom alokasi (Qty_Alokasi
+# dst.) tidak dihitung karena butuh seluruh SO line diurutkan sekaligus.
+# Hanya satu lokasi stock (satu sheet Loct_*) per workbook; kolom lokasi di
+# SO_B2B diabaikan.
+
+CHUNK_ROWS = 200_000
+
+# Kolom detail per line yang ditulis ke Parquet (batch kosong = null)
+SPILL_SCHEMA = pa.schema([
+    ('Shipment Number', pa.string()),
+    ('Material', pa.string()),
+    ('Batch Number', pa.string()),
+    ('Ordered Quantity', pa.float64()),
+    ('Stock_Batch', pa.float64()),
+    ('Balance_Per_Line', pa.float64()),
+    ('Total_Stock_Material', pa.float64()),
+    ('Status_Stock', pa.string()),
+])
+SHIPMENT_COLUMNS = ['Material', 'Batch Number', 'Shipment Number']
+
+
+def _spill_table(df_detail):
+    df = df_detail[SPILL_SCHEMA.names].astype({'Status_Stock': object, 'Shipment Number': object})
+    return pa.Table.from_pandas(df, schema=SPILL_SCHEMA, preserve_index=False)
+
+
+def run_streaming(file, detail_path, chunk_rows=CHUNK_ROWS, number_format='auto'):
+    # Hasil: dict seperti run_analysis (cube, material, deficit, substitusi)
+    # plus path detail Parquet dan statistik; error input -> ValueError
+    start = time.perf_counter()
+    wb, error_msg = open_workbook(file)
+    if error_msg:
+        raise ValueError(error_msg)
+
+    stats = {'so_lines': 0, 'line_defisit': 0, 'line_tanpa_batch': 0, 'chunks': 0, 'parse': []}
+    tmp_path = f"{detail_path}.tmp-{uuid.uuid4().hex}"
+    try:
+        sheets = stock_sheets(wb.sheetnames)
+        if len(sheets) > 1:
+            raise ValueError(f"Mode streaming hanya untuk satu sheet stock, ditemukan: {', '.join(sheets)}")
+        df_loct, parse_reports = next(iter_sheet_chunks(wb[sheets[0]], sheets[0], number_format))
+        error_msg = missing_columns_error(df_loct, sheets[0])
+        if error_msg:
+            raise ValueError(error_msg)
+        if LOCATION_COLUMN in df_loct.columns:
+            if df_loct[LOCATION_COLUMN].nunique() > 1:
+                raise ValueError(f"Mode streaming hanya untuk satu lokasi stock (kolom lokasi di sheet {sheets[0]})")
+            df_loct = df_loct.drop(columns=LOCATION_COLUMN)
+        stats['parse'].extend(parse_reports)
+        stats['stock_rows'] = len(df_loct)
+
+        stock, stock_material = aggregate_stock(preprocess_loct(df_loct))
+        del df_loct
+        # Cube tanpa demand cukup untuk lookup stock per line
+        stock_cube, material = combine_cube(stock, stock_material, aggregate_demand(
+            pd.DataFrame(columns=['Material', 'Batch Number', 'Ordered Quantity'])
+        ))
+
+        demand = None
+        with pq.ParquetWriter(tmp_path, SPILL_SCHEMA) as writer:
+            for chunk, parse_reports in iter_sheet_chunks(wb['SO_B2B'], 'SO_B2B', number_format, chunk_rows):
+                if stats['chunks'] == 0:
+                    error_msg = missing_columns_error(chunk, 'SO_B2B')
+                    if error_msg:
+                        raise ValueError(error_msg)
+                stats['parse'].extend(parse_reports)
+                stats['chunks'] += 1
+
+                chunk = preprocess_so(chunk)
+                demand = merge_demand(demand, aggregate_demand(chunk))
+
+                detail = build_detail(chunk, stock_cube, material, fill_missing_batch=False)
+                stats['so_lines'] += len(detail)
+                stats['line_defisit'] += int((detail['Status_Stock'] == DEFISIT).sum())
+                stats['line_tanpa_batch'] += int(is_tanpa_batch(detail['Batch Number']).sum())
+                writer.write_table(_spill_table(detail))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        wb.close()
+    os.replace(tmp_path, detail_path)
+
+    cube, material = combine_cube(stock, stock_material, demand)
+
+    # Pass kedua atas detail di disk: daftar shipment hanya untuk batch defisit
+    deficit_index = deficit_batches(cube).index
+    shipments = [
+        deficit_shipments(batch.to_pandas(), deficit_index)
+        for batch in pq.ParquetFile(detail_path).iter_batches(batch_size=chunk_rows, columns=SHIPMENT_COLUMNS)
+    ]
+    shipments = pd.concat(shipments).drop_duplicates() if shipments else pd.DataFrame(columns=SHIPMENT_COLUMNS)
+    deficit_df = build_deficit(cube, shipments)
+    stats['seconds'] = time.perf_counter() - start
+
+    return {
+        'cube': cube,
+        'material': material,
+        'deficit': deficit_df,
+        'substitusi': build_substitution(cube, deficit_df),
+        'has_batch': bool((cube['Baris_SO'] > 0).any()),
+        'detail_path': detail_path,
+        'stats': stats,
+    }
@@ -0,0 +1,105 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from export import write_xlsx_streaming
+
+# Generator workbook sintetis (sheet SO_B2B + Loct_F211) untuk benchmark dan
+# uji beban tanpa data customer. Semua parameter bisa diatur: jumlah SKU,
+# batch per SKU, SO line, porsi line tanpa batch, skew demand antar SKU
+# (Zipf; 0 = merata), dan jumlah lokasi stock (sheet Loct_F211, Loct_F212, ...).
+#
+#   python synthetic.py contoh.xlsx --skus 5000 --lines 100000 --skew 1.1
+#   python synthetic.py multi.xlsx --locations 4
+
+
+def _demand_weights(skus, skew):
+    weights = 1.0 / np.arange(1, skus + 1) ** skew
+    return weights / weights.sum()
+
+
+def _as_text_numbers(values, share, rng):
+    # Sebagian qty ditulis sebagai teks ribuan ("1,234") seperti export SAP
+    values = pd.Series(values, dtype=object)
+    as_text = rng.random(len(values)) < share
+    values[as_text] = [f"{v:,.0f}" for v in values[as_text]]
+    return values
+
+
+def generate_frames(skus=1000, batches_per_sku=5, so_lines=10_000, no_batch_share=0.3, skew=1.0,
+                    stock_ratio=1.0, text_number_share=0.0, seed=0):
+    # Hasil: df_so, df_loct dengan kolom yang sama seperti workbook asli.
+    # stock_ratio = total stock / total demand (< 1 -> banyak defisit)
+    rng = np.random.default_rng(seed)
+    materials = np.array([f"MAT{i:07d}" for i in range(skus)], dtype=object)
+    batches = np.array([f"B{i:04d}" for i in range(batches_per_sku)], dtype=object)
+
+    # --- SO_B2B ---
+    sku_idx = rng.choice(skus, size=so_lines, p=_demand_weights(skus, skew))
+    batch_idx = rng.integers(0, batches_per_sku, size=so_lines)
+    qty = rng.integers(1, 100, size=so_lines).astype('float64')
+    batch_number = batches[batch_idx].astype(object)
+    batch_number[rng.random(so_lines) < no_batch_share] = None
+    df_so = pd.DataFrame({
+        'Shipment Number': np.char.add('SHP', (rng.integers(0, max(so_lines // 5, 1), size=so_lines)).astype(str)).astype(object),
+        'Material': materials[sku_idx],
+        'Batch Number': batch_number,
+        'Ordered Quantity': _as_text_numbers(qty, text_number_share, rng) if text_number_share else qty,
+    })
+
+    # --- Loct_F211: satu baris per (SKU, batch), stock ~ demand batch itu x stock_ratio ---
+    demand = np.bincount(sku_idx * batches_per_sku + batch_idx, weights=qty, minlength=skus * batches_per_sku)
+    stock = np.round(demand * stock_ratio * rng.uniform(0.5, 1.5, size=demand.size))
+    expiry = pd.Timestamp('2027-01-01') + pd.to_timedelta(rng.integers(0, 720, size=demand.size), unit='D')
+    df_loct = pd.DataFrame({
+        'Material': np.repeat(materials, batches_per_sku),
+        'Batch': np.tile(batches, skus),
+        'Unrestricted': _as_text_numbers(stock, text_number_share, rng) if text_number_share else stock,
+        'SLED/BBD': expiry,
+    })
+    return df_so, df_loct
+
+
+def split_stock(df_loct, locations=1, seed=0):
+    # Stock tiap baris dibagi acak ke beberapa lokasi; hasil {nama sheet: frame}
+    if locations <= 1:
+        return {'Loct_F211': df_loct}
+    rng = np.random.default_rng(seed)
+    shares = rng.dirichlet(np.ones(locations), size=len(df_loct))
+    stock = pd.to_numeric(df_loct['Unrestricted'].astype(str).str.replace(',', ''), errors='coerce').to_numpy()
+    return {
+        f"Loct_F{211 + i}": df_loct.assign(Unrestricted=np.round(stock * shares[:, i]))
+        for i in range(locations)
+    }
+
+
+def write_workbook(path, df_so, df_loct, locations=1, seed=0):
+    write_xlsx_streaming(path, {'SO_B2B': df_so, **split_stock(df_loct, locations, seed)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Buat workbook SO_B2B/Loct_F211 sintetis.")
+    parser.add_argument('output', help="Path file .xlsx")
+    parser.add_argument('--skus', type=int, default=1000)
+    parser.add_argument('--batches', type=int, default=5, help="Jumlah batch per SKU")
+    parser.add_argument('--lines', type=int, default=10_000, help="Jumlah SO line")
+    parser.add_argument('--no-batch', type=float, default=0.3, help="Porsi SO line tanpa batch (0-1)")
+    parser.add_argument('--skew', type=float, default=1.0, help="Eksponen Zipf demand antar SKU (0 = merata)")
+    parser.add_argument('--stock-ratio', type=float, default=1.0, help="Total stock / total demand")
+    parser.add_argument('--text-numbers', type=float, default=0.0, help="Porsi angka yang ditulis sebagai teks")
+    parser.add_argument('--locations', type=int, default=1, help="Jumlah lokasi stock (sheet Loct_*)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df_so, df_loct = generate_frames(
+        args.skus, args.batches, args.lines, args.no_batch, args.skew, args.stock_ratio, args.text_numbers, args.seed
+    )
+    write_workbook(args.output, df_so, df_loct, args.locations, args.seed)
+    print(f"{args.output}: {len(df_so):,} SO line, {len(df_loct):,} baris stock x {args.locations} lokasi")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import allocate_stock
+from analysis import preprocess
+from cube import build_stock_cube
+from synthetic import generate_frames
+
+# allocate_stock (cumsum + irisan interval) dibandingkan dengan loop Python
+# per line yang mengikuti aturan alokasi secara harfiah.
+
+
+def naive_allocation(df_so, cube, line_priority, batch_order):
+    stock = cube[cube['Baris_Stock'] > 0].reset_index()
+    stock = stock.sort_values(['Material', batch_order, 'Batch'] if batch_order != 'Batch' else ['Material', 'Batch'],
+                              kind='stable')
+    remaining = {(m, b): max(s, 0.0) for m, b, s in zip(stock['Material'], stock['Batch'], stock['Stock'])}
+    batch_order_per_material = {}
+    for m, b in zip(stock['Material'], stock['Batch']):
+        batch_order_per_material.setdefault(m, []).append(b)
+
+    qty = df_so['Ordered Quantity'].fillna(0).clip(lower=0).tolist()
+    rows = list(range(len(df_so)))
+    priority = [df_so[col].tolist() for col in line_priority]
+    materials = df_so['Material'].tolist()
+    batches = df_so['Batch Number'].tolist()
+    has_batch = df_so['Batch Number'].notna().tolist()
+
+    def sort_key(i):
+        return tuple(values[i] for values in priority) + (i,)
+
+    alokasi = [0.0] * len(df_so)
+    sisa = [0.0] * len(df_so)
+    # Line dengan batch: FIFO per (Material, Batch) sesuai prioritas
+    for i in sorted((i for i in rows if has_batch[i]), key=sort_key):
+        key = (materials[i], batches[i])
+        avail = remaining.get(key, 0.0)
+        alokasi[i] = min(qty[i], avail)
+        if key in remaining:
+            remaining[key] = avail - alokasi[i]
+        sisa[i] = remaining.get(key, 0.0)
+
+    # Line tanpa batch: sisa stock per batch sesuai urutan batch material itu
+    pairs = []
+    for i in sorted((i for i in rows if not has_batch[i]), key=sort_key):
+        need = qty[i]
+        for b in batch_order_per_material.get(materials[i], []):
+            take = min(need, remaining[(materials[i], b)])
+            if take > 1e-9:
+                pairs.append((i, b, take))
+                remaining[(materials[i], b)] -= take
+                need -= take
+        alokasi[i] = qty[i] - need
+        sisa[i] = sum(remaining[(materials[i], b)] for b in batch_order_per_material.get(materials[i], []))
+
+    per_line = pd.DataFrame({
+        'Qty_Alokasi': alokasi,
+        'Sisa_Stock_Alokasi': sisa,
+        'Kekurangan_Alokasi': np.subtract(qty, alokasi),
+    })
+    pairs = pd.DataFrame(pairs, columns=['Line_Index', 'Batch', 'Qty_Alokasi'])
+    return per_line, pairs
+
+
+def _frames(seed, stock_ratio):
+    df_so, df_loct = generate_frames(skus=40, batches_per_sku=4, so_lines=1500, no_batch_share=0.4, skew=1.2,
+                                     stock_ratio=stock_ratio, seed=seed)
+    rng = np.random.default_rng(seed)
+    # Kasus tepi: qty kosong/negatif, stock negatif, batch SO yang tidak ada di stock
+    df_so.loc[rng.random(len(df_so)) < 0.02, 'Ordered Quantity'] = np.nan
+    df_so.loc[rng.random(len(df_so)) < 0.02, 'Ordered Quantity'] = -5.0
+    df_loct.loc[rng.random(len(df_loct)) < 0.05, 'Unrestricted'] = -10.0
+    df_so.loc[rng.random(len(df_so)) < 0.02, 'Batch Number'] = 'B9999'
+    return preprocess(df_so, df_loct)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('stock_ratio', [0.6, 1.3])
+@pytest.mark.parametrize('line_priority, batch_order', [
+    (('Shipment Number',), 'Batch'),
+    ((), 'Batch'),
+    (('Shipment Number',), 'SLED/BBD'),
+])
+def test_allocation_matches_naive_loop(seed, stock_ratio, line_priority, batch_order):
+    df_so, df_loct = _frames(seed, stock_ratio)
+    cube, _ = build_stock_cube(df_so, df_loct)
+
+    per_line, pairs = allocate_stock(df_so, cube, line_priority, batch_order)
+    expected_line, expected_pairs = naive_allocation(df_so, cube, line_priority, batch_order)
+
+    pd.testing.assert_frame_equal(per_line, expected_line, check_exact=False, atol=1e-6)
+    pairs = pairs.sort_values(['Line_Index', 'Batch']).reset_index(drop=True)
+    expected_pairs = expected_pairs.sort_values(['Line_Index', 'Batch']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(pairs, expected_pairs, check_dtype=False, check_exact=False, atol=1e-6)
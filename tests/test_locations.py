@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import locations
+from analysis import run_analysis
+from ingest import LOCATION_COLUMN, read_workbook
+from locations import run_locations, run_partitioned
+from synthetic import generate_frames
+
+# Analisis multi-lokasi dari workbook dengan beberapa sheet Loct_*, dan
+# partisi material di process pool yang harus sama dengan analisis satu proses.
+
+FRAMES = ['detail', 'alokasi_tanpa_batch', 'deficit', 'substitusi', 'cube', 'material']
+
+
+def assert_same_result(result, expected):
+    for name in FRAMES:
+        left, right = result[name], expected[name]
+        if name == 'alokasi_tanpa_batch':
+            # Urutan pasangan tidak bermakna (hasil satu proses urut per material + prioritas)
+            left, right = (df.sort_values(['Line_Index', 'Batch']) for df in (left, right))
+        if name not in ('cube', 'material'):
+            left, right = left.reset_index(drop=True), right.reset_index(drop=True)
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, obj=name)
+
+
+def _write_workbook(path, sheets):
+    wb = Workbook()
+    wb.remove(wb.active)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(title=name)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+    return path
+
+
+def test_stock_sheets_sharing_a_plant_stay_separate_locations(tmp_path):
+    # Kolom Plant SAP sama untuk semua sheet; lokasi tetap dari nama sheet
+    path = _write_workbook(tmp_path / 'plant.xlsx', {
+        'SO_B2B': [
+            ['Shipment Number', 'Material', 'Batch Number', 'Ordered Quantity', 'Plant'],
+            ['SHP1', 'M1', 'B1', 20, '1000'],
+        ],
+        'Loct_F211': [['Plant', 'Material', 'Batch', 'Unrestricted'], ['1000', 'M1', 'B1', 5]],
+        'Loct_F212': [['Plant', 'Material', 'Batch', 'Unrestricted'], ['1000', 'M1', 'B1', 30]],
+    })
+
+    df_so, df_loct, error_msg, _ = read_workbook(path)
+    assert error_msg is None
+    assert sorted(df_loct[LOCATION_COLUMN].unique()) == ['F211', 'F212']
+
+    analysis = run_locations(df_so, df_loct, workers=1)
+    assert sorted(analysis['locations']) == ['F211', 'F212']
+    deficit = analysis['locations']['F211']['deficit']
+    assert deficit['Balance'].tolist() == [-15]
+    assert analysis['locations']['F212']['deficit'].empty
+
+    cross = analysis['cross']
+    assert cross[['Lokasi', 'Lokasi_Sumber', 'Qty_Bisa_Dipindah']].values.tolist() == [['F211', 'F212', 10]]
+
+
+def test_storage_location_column_overrides_sheet_name(tmp_path):
+    path = _write_workbook(tmp_path / 'sloc.xlsx', {
+        'SO_B2B': [['Shipment Number', 'Material', 'Batch Number', 'Ordered Quantity'], ['SHP1', 'M1', 'B1', 1]],
+        'Loct_Gudang': [
+            ['SLoc', 'Material', 'Batch', 'Unrestricted'],
+            ['F211', 'M1', 'B1', 5],
+            ['F212', 'M1', 'B1', 30],
+            [None, 'M1', 'B2', 7],
+        ],
+    })
+
+    _, df_loct, error_msg, _ = read_workbook(path)
+    assert error_msg is None
+    assert df_loct[LOCATION_COLUMN].tolist() == ['F211', 'F212', 'Gudang']
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('line_priority, batch_order', [(('Shipment Number',), 'Batch'), ((), 'SLED/BBD')])
+def test_partitioned_matches_single_process(monkeypatch, compact, line_priority, batch_order):
+    # Partisi kecil supaya data uji terbagi ke beberapa worker
+    monkeypatch.setattr(locations, 'PARTITION_LINES', 500)
+    df_so, df_loct = generate_frames(skus=60, batches_per_sku=4, so_lines=3000, no_batch_share=0.3, stock_ratio=0.9,
+                                     seed=5)
+
+    result = run_partitioned(df_so.copy(), df_loct.copy(), line_priority, batch_order, compact, workers=2)
+    expected = run_analysis(df_so.copy(), df_loct.copy(), line_priority, batch_order, compact)
+
+    assert [record['stage'] for record in result['stages']][:2] == ['preprocessing', 'partitions']
+    assert_same_result(result, expected)
+
+
+def test_locations_match_separate_analysis():
+    df_so, df_loct = generate_frames(skus=40, batches_per_sku=3, so_lines=2000, seed=6)
+    df_loct = df_loct.assign(**{LOCATION_COLUMN: ['F211', 'F212'] * (len(df_loct) // 2)})
+
+    analysis = run_locations(df_so, df_loct, workers=1)
+    for location in ['F211', 'F212']:
+        loct_part = df_loct[df_loct[LOCATION_COLUMN] == location].drop(columns=LOCATION_COLUMN)
+        assert_same_result(analysis['locations'][location], run_analysis(df_so.copy(), loct_part))
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from ingest import SO_SHEET, iter_sheet_chunks, open_workbook
+from numeric import detect_separators, parse_number_column
+
+# Parsing kolom angka teks: deteksi format EN/ID, spasi pemisah ribuan, dan
+# laporan nilai yang gagal diparsing.
+
+
+def _text(values):
+    return pd.Series(values, dtype='str', name='Ordered Quantity')
+
+
+@pytest.mark.parametrize('values, expected, separators', [
+    (['1.234,5', '2.000', '10,25'], [1234.5, 2000.0, 10.25], ('.', ',')),
+    (['1,234.5', '2,000', '10.25'], [1234.5, 2000.0, 10.25], (',', '.')),
+    (['1.234.567', '3'], [1234567.0, 3.0], ('.', ',')),
+    (['1,234,567', '3'], [1234567.0, 3.0], (',', '.')),
+])
+def test_auto_detects_format(values, expected, separators):
+    parsed, report = parse_number_column(_text(values))
+    np.testing.assert_allclose(parsed.to_numpy(), expected)
+    assert (report['thousands'], report['decimal']) == separators
+    assert report['coerced'] == 0
+
+
+@pytest.mark.parametrize('values', [['1,234', '5'], ['1.000', '20'], ['1,234.5', '1.234,5'], ['7', '8']])
+def test_ambiguous_column_is_not_locked(values):
+    # Tanpa bukti (atau bukti seimbang) format tidak dilaporkan; parsing memakai EN
+    assert detect_separators(_text(values)) is None
+    _, report = parse_number_column(_text(values))
+    assert report['thousands'] is None and report['decimal'] is None
+
+
+def test_ambiguous_column_parses_as_en():
+    parsed, _ = parse_number_column(_text(['1,234', '5']))
+    np.testing.assert_allclose(parsed.to_numpy(), [1234.0, 5.0])
+
+
+@pytest.mark.parametrize('value, number_format, expected', [
+    ('\xa01.000,5', 'auto', 1000.5),
+    ('1\xa0234,5', 'id', 1234.5),
+    ('1\u202f234\u202f567,25', 'auto', 1234567.25),
+    ('12\u202f345.5', 'en', 12345.5),
+    (' 1 234 ', 'en', 1234.0),
+])
+def test_strips_nbsp_and_narrow_nbsp(value, number_format, expected):
+    parsed, report = parse_number_column(_text([value]), number_format)
+    assert parsed.iloc[0] == pytest.approx(expected)
+    assert report['coerced'] == 0
+
+
+def test_manual_format_and_sap_negative():
+    parsed, report = parse_number_column(_text(['1.234,5-', '12,5']), 'id')
+    np.testing.assert_allclose(parsed.to_numpy(), [-1234.5, 12.5])
+    assert (report['thousands'], report['decimal']) == ('.', ',')
+
+
+def test_invalid_text_is_reported():
+    series = pd.Series([5, '1.234,5', 'abc', None, ''], dtype=object, name='Ordered Quantity')
+    parsed, report = parse_number_column(series)
+    assert parsed.iloc[0] == 5 and parsed.iloc[1] == 1234.5
+    assert parsed.iloc[2:].isna().all()
+    assert report['coerced'] == 1
+    assert report['sample'] == [{'row': 2, 'value': 'abc'}]
+
+
+def test_chunk_format_locks_only_after_evidence(tmp_path):
+    # Chunk pertama tanpa bukti tidak mengunci EN; chunk kedua terdeteksi ID
+    wb = Workbook()
+    ws = wb.active
+    ws.title = SO_SHEET
+    ws.append(['Shipment Number', 'Material', 'Batch Number', 'Ordered Quantity'])
+    for qty in ['5', '7', '1.234,5', '2,5', '3']:
+        ws.append(['SHP1', 'M1', 'B1', qty])
+    wb.create_sheet('Loct_F211').append(['Material', 'Batch', 'Unrestricted'])
+    wb.save(tmp_path / 'chunks.xlsx')
+
+    wb, _ = open_workbook(tmp_path / 'chunks.xlsx')
+    chunks = list(iter_sheet_chunks(wb[SO_SHEET], SO_SHEET, chunk_rows=2))
+    wb.close()
+    qty = pd.concat([df['Ordered Quantity'] for df, _ in chunks], ignore_index=True)
+    np.testing.assert_allclose(qty.to_numpy(), [5.0, 7.0, 1234.5, 2.5, 3.0])
+    assert [reports[0]['thousands'] for _, reports in chunks] == [None, '.', '.']
@@ -0,0 +1,47 @@
+import pandas as pd
+import pytest
+
+from analysis import TANPA_BATCH, run_analysis
+from ingest import LOCATION_COLUMN, read_workbook
+from streaming import SPILL_SCHEMA, run_streaming
+from synthetic import generate_frames, write_workbook
+
+# Mode streaming (SO_B2B per chunk) harus memberi defisit, substitusi, cube
+# dan detail per line yang sama dengan analisis in-memory atas workbook yang sama.
+
+
+@pytest.fixture(scope='module')
+def workbook(tmp_path_factory):
+    df_so, df_loct = generate_frames(skus=80, batches_per_sku=4, so_lines=3000, no_batch_share=0.3, stock_ratio=0.9,
+                                     text_number_share=0.2, seed=3)
+    path = tmp_path_factory.mktemp('streaming') / 'input.xlsx'
+    write_workbook(path, df_so, df_loct)
+    return path
+
+
+@pytest.fixture(scope='module')
+def in_memory(workbook):
+    df_so, df_loct, error_msg, _ = read_workbook(workbook)
+    assert error_msg is None
+    return run_analysis(df_so, df_loct.drop(columns=LOCATION_COLUMN))
+
+
+@pytest.mark.parametrize('chunk_rows', [700, 3000, 10_000])
+def test_streaming_matches_in_memory(workbook, in_memory, tmp_path, chunk_rows):
+    result = run_streaming(workbook, tmp_path / 'detail.parquet', chunk_rows)
+
+    assert result['stats']['so_lines'] == len(in_memory['detail'])
+    for name in ['cube', 'material']:
+        pd.testing.assert_frame_equal(result[name], in_memory[name], check_dtype=False, obj=name)
+    for name in ['deficit', 'substitusi']:
+        pd.testing.assert_frame_equal(result[name].reset_index(drop=True), in_memory[name].reset_index(drop=True),
+                                      check_dtype=False, obj=name)
+
+    # Detail di Parquet: batch kosong null (in-memory: sentinel 'TANPA BATCH')
+    detail = pd.read_parquet(result['detail_path'])
+    expected = in_memory['detail'][SPILL_SCHEMA.names].copy()
+    expected['Batch Number'] = expected['Batch Number'].mask(expected['Batch Number'] == TANPA_BATCH)
+    for df in (detail, expected):
+        for col in ['Shipment Number', 'Material', 'Batch Number', 'Status_Stock']:
+            df[col] = df[col].astype(object)
+    pd.testing.assert_frame_equal(detail, expected, check_dtype=False)